@@ -4,17 +4,23 @@ import logging
 import asyncio
 import zipfile
 import tempfile
-import io
+import time
+import random
+import cProfile
+import contextvars
 from typing import Dict, Any, List, Optional
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from urllib.parse import urljoin
 import re
+import unicodedata
 import aiohttp
 import asyncpg
-import requests
 from bs4 import BeautifulSoup
 from datetime import datetime
 
 from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 # --- Logging Setup ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -22,6 +28,7 @@ logger = logging.getLogger(__name__)
 
 # --- Environment Variables ---
 TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org").rstrip('/') # Overridden by the load test's fake Bot API
 WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "a-random-string")
 OWNER_ID = os.environ.get("OWNER_ID")
 DATABASE_URL = os.environ.get("DATABASE_URL")
@@ -29,11 +36,319 @@ LOG_GROUP_ID = os.environ.get("LOG_GROUP_ID")
 FORCE_SUB_CHANNEL_ID = os.environ.get("FORCE_SUB_CHANNEL_ID")
 FORCE_SUB_CHANNEL_LINK = os.environ.get("FORCE_SUB_CHANNEL_LINK")
 BASE_URL = "https://malayalamsubtitles.org"
+HTTP_POOL_LIMIT = int(os.environ.get("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.environ.get("HTTP_POOL_LIMIT_PER_HOST", "30"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.environ.get("HTTP_KEEPALIVE_TIMEOUT", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_TOTAL_TIMEOUT = float(os.environ.get("HTTP_TOTAL_TIMEOUT", "30"))
+DOWNLOAD_TIMEOUT = float(os.environ.get("DOWNLOAD_TIMEOUT", "120"))
+DOWNLOAD_MAX_BYTES = int(os.environ.get("DOWNLOAD_MAX_BYTES", str(50 * 1024 * 1024))) # Telegram's bot upload limit
+DOWNLOAD_SPOOL_MEMORY = int(os.environ.get("DOWNLOAD_SPOOL_MEMORY", str(1024 * 1024))) # Spill to disk above this
+MAX_CONCURRENT_DOWNLOADS = int(os.environ.get("MAX_CONCURRENT_DOWNLOADS", "3"))
+TELEGRAM_GLOBAL_RATE = float(os.environ.get("TELEGRAM_GLOBAL_RATE", "30")) # Outbound calls per second across all chats
+TELEGRAM_CHAT_RATE = float(os.environ.get("TELEGRAM_CHAT_RATE", "1")) # Messages per second to a single chat
+TELEGRAM_CHAT_BURST = int(os.environ.get("TELEGRAM_CHAT_BURST", "3"))
+TELEGRAM_MAX_RETRIES = int(os.environ.get("TELEGRAM_MAX_RETRIES", "3"))
+PRIORITY_INTERACTIVE = 0 # Replies to users; always served before bulk traffic
+PRIORITY_BULK = 1 # Broadcasts
+WEBHOOK_REPLY = os.environ.get("WEBHOOK_REPLY", "false").lower() in ("1", "true", "yes") # Answer updates in the webhook response body
+UPDATE_WORKERS = int(os.environ.get("UPDATE_WORKERS", "4"))
+UPDATE_QUEUE_SIZE = int(os.environ.get("UPDATE_QUEUE_SIZE", "1000")) # Per worker
+UPDATE_DEDUPE_SIZE = int(os.environ.get("UPDATE_DEDUPE_SIZE", "10000")) # Recent update_ids remembered to drop redeliveries
+USER_FLUSH_INTERVAL = float(os.environ.get("USER_FLUSH_INTERVAL", "10"))
+BROADCAST_BATCH_SIZE = int(os.environ.get("BROADCAST_BATCH_SIZE", "100"))
+BROADCAST_PROGRESS_INTERVAL = float(os.environ.get("BROADCAST_PROGRESS_INTERVAL", "15"))
+ADMIN_JOB_WORKERS = int(os.environ.get("ADMIN_JOB_WORKERS", "2"))
+SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", "1000"))
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", "600"))
+MEMBERSHIP_CACHE_SIZE = int(os.environ.get("MEMBERSHIP_CACHE_SIZE", "50000"))
+MEMBERSHIP_TTL = float(os.environ.get("MEMBERSHIP_TTL", "900")) # How long a confirmed member is trusted
+MEMBERSHIP_NEGATIVE_TTL = float(os.environ.get("MEMBERSHIP_NEGATIVE_TTL", "30")) # How long a non-member is
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN") # If set, /metrics requires "Authorization: Bearer <token>"
+PROFILE_ENABLED = os.environ.get("PROFILE_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0.01")) # Fraction of updates profiled when enabled
+PROFILE_SLOW_THRESHOLD = float(os.environ.get("PROFILE_SLOW_THRESHOLD", "2")) # Seconds; slower updates are always recorded
+PROFILE_CPROFILE = os.environ.get("PROFILE_CPROFILE", "false").lower() in ("1", "true", "yes") # Dump pstats while a sampled update runs
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "bot-profiles"))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "20")) # pstats files kept in PROFILE_DIR
+FAST_HTML_PARSE = os.environ.get("FAST_HTML_PARSE", "false").lower() in ("1", "true", "yes") # Parse release pages with lxml instead of html.parser
+SEARCH_ENGINE = os.environ.get("SEARCH_ENGINE", "sql").lower() # 'memory' enables the in-process trigram index
+SEARCH_SIMILARITY_THRESHOLD = 0.15
+SEARCH_LIMIT = 10
+SUBTITLES_CHANNEL = "subtitles_changed" # Postgres NOTIFY channel the scraper signals after writes
 
 # --- Global Variables ---
 db_pool: Optional[asyncpg.Pool] = None
+db_listen_conn: Optional[asyncpg.Connection] = None # Dedicated connection for LISTEN
+http_session: Optional[aiohttp.ClientSession] = None # Shared keep-alive client for Telegram and downloads
 admin_tasks: Dict[str, str] = {} # To track next action for owner
 feedback_tasks: Dict[int, bool] = {} # To track users who are sending feedback
+admin_job_queue: Optional[asyncio.Queue] = None # Pending admin scrape jobs
+admin_job_workers: List[asyncio.Task] = []
+broadcast_tasks: set = set() # Running broadcast jobs
+update_queues: List[asyncio.Queue] = [] # One per update worker; a chat always maps to the same queue
+update_workers: List[asyncio.Task] = []
+recent_update_ids: "OrderedDict[int, None]" = OrderedDict()
+known_user_ids: set = set() # Every user_id in the users table or waiting to be flushed
+seen_users: Dict[int, datetime] = {} # user_id -> last seen, written in batches by flush_users
+new_user_count = 0 # Users in seen_users that are not yet in the table
+user_flush_task: Optional[asyncio.Task] = None
+download_semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS) # Caps concurrent origin downloads
+downloads_waiting = 0
+
+# --- Caches ---
+class TTLCache:
+    """A size-bounded LRU cache whose entries expire after a TTL."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data: "OrderedDict[Any, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Any) -> Optional[Any]:
+        item = self.data.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None: del self.data[key]
+            self.misses += 1
+            return None
+        self.data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key: Any, value: Any, ttl: Optional[float] = None):
+        self.data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def pop(self, key: Any):
+        self.data.pop(key, None)
+
+    def clear(self):
+        self.data.clear()
+
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+search_cache = TTLCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+membership_cache = TTLCache(MEMBERSHIP_CACHE_SIZE, MEMBERSHIP_TTL)
+
+# --- Metrics ---
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    """A Prometheus-style latency histogram with a single label."""
+
+    def __init__(self, name: str, help_text: str, label: str, stage: Optional[str] = None):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.stage = stage  # Prefix for the time this adds to a profiled update's stage breakdown
+        self.series: Dict[str, list] = {}  # label value -> [cumulative bucket counts..., sum, count]
+
+    def observe(self, label_value: str, seconds: float):
+        counts = self.series.setdefault(label_value, [0] * len(LATENCY_BUCKETS) + [0.0, 0])
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound: counts[i] += 1
+        counts[-2] += seconds
+        counts[-1] += 1
+
+    @contextmanager
+    def time(self, label_value: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe(label_value, elapsed)
+            if self.stage: add_stage_time(f"{self.stage}:{label_value}", elapsed)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for value, counts in self.series.items():
+            label = f'{self.label}="{value}"'
+            lines += [f'{self.name}_bucket{{{label},le="{bound}"}} {counts[i]}' for i, bound in enumerate(LATENCY_BUCKETS)]
+            lines += [f'{self.name}_bucket{{{label},le="+Inf"}} {counts[-1]}', f"{self.name}_sum{{{label}}} {counts[-2]:.6f}", f"{self.name}_count{{{label}}} {counts[-1]}"]
+        return lines
+
+UPDATE_LATENCY = Histogram("bot_update_seconds", "Time to handle a Telegram update.", "stage")
+SQL_LATENCY = Histogram("bot_sql_seconds", "Time spent in SQL queries by query type.", "query", stage="db")
+TELEGRAM_LATENCY = Histogram("bot_telegram_request_seconds", "Time spent in Bot API requests by method.", "method", stage="telegram")
+DOWNLOAD_LATENCY = Histogram("bot_origin_download_seconds", "Time to download subtitle archives from the origin.", "result")
+in_flight: Dict[str, int] = {'updates': 0, 'telegram_requests': 0, 'downloads': 0}
+
+@contextmanager
+def track_in_flight(name: str):
+    in_flight[name] += 1
+    try:
+        yield
+    finally:
+        in_flight[name] -= 1
+
+# --- Update Profiler ---
+current_profile: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar('current_profile', default=None)
+
+def add_stage_time(stage: str, seconds: float):
+    if (record := current_profile.get()) is not None:
+        record['stages'][stage] = record['stages'].get(stage, 0.0) + seconds
+
+@contextmanager
+def profile_stage(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_stage_time(stage, time.perf_counter() - started)
+
+def spawn_background(coro) -> asyncio.Task:
+    """Starts a task that outlives the current update, without inheriting its profile record."""
+    context = contextvars.copy_context()
+    context.run(current_profile.set, None)
+    return asyncio.create_task(coro, context=context)
+
+def _describe_update(update: dict) -> str:
+    # Only the command or callback action is kept, never the user's text.
+    if callback_query := update.get('callback_query'):
+        return f"callback:{callback_query.get('data', '').partition('_')[0]}"
+    text = (update.get('message') or {}).get('text', '')
+    return text.split()[0] if text.startswith('/') else 'message'
+
+class UpdateProfiler:
+    """Records per-stage timings for a sample of updates and for every update slower than a threshold.
+
+    Stage timings belong to the update alone. A cProfile dump does not: cProfile traces the whole event-loop
+    thread, so while the sampled update awaits, every other worker's updates are recorded too. The dump is a
+    profile of the process for that window, and only a per-update profile when UPDATE_WORKERS=1.
+    """
+
+    def __init__(self):
+        self.enabled = PROFILE_ENABLED
+        self.sample_rate = PROFILE_SAMPLE_RATE
+        self.slow_threshold = PROFILE_SLOW_THRESHOLD
+        self.recent: deque = deque(maxlen=200)
+        self.cprofile_busy = False # cProfile can only run one profile at a time
+        if PROFILE_CPROFILE and UPDATE_WORKERS > 1:
+            logger.warning(f"PROFILE_CPROFILE dumps cover all {UPDATE_WORKERS} update workers; set UPDATE_WORKERS=1 for per-update profiles.")
+
+    async def run(self, update: dict, handler):
+        if not self.enabled:
+            return await handler()
+        sampled = random.random() < self.sample_rate
+        record = {'update_id': update.get('update_id'), 'kind': _describe_update(update), 'stages': {}, 'at': datetime.now()}
+        profiler = None
+        if sampled and PROFILE_CPROFILE and not self.cprofile_busy:
+            self.cprofile_busy = True
+            profiler = cProfile.Profile()
+            profiler.enable()
+        token = current_profile.set(record)
+        started = time.perf_counter()
+        try:
+            return await handler()
+        finally:
+            record['total'] = time.perf_counter() - started
+            current_profile.reset(token)
+            if profiler:
+                profiler.disable()
+                self.cprofile_busy = False
+            if sampled or record['total'] >= self.slow_threshold:
+                if profiler: record['pstats'] = self._dump(profiler, record)
+                self.recent.append(record)
+                if record['total'] >= self.slow_threshold:
+                    logger.warning(f"Slow update {record['update_id']} ({record['kind']}): {self.format(record)}")
+
+    def _dump(self, profiler: cProfile.Profile, record: Dict) -> Optional[str]:
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            # Named after the sampled update, but it covers everything the process ran meanwhile (see the class docstring).
+            path = os.path.join(PROFILE_DIR, f"{record['at']:%Y%m%d-%H%M%S}-{record['update_id']}.pstats")
+            profiler.dump_stats(path)
+            dumps = sorted((os.path.join(PROFILE_DIR, f) for f in os.listdir(PROFILE_DIR) if f.endswith('.pstats')), key=os.path.getmtime)
+            for old in dumps[:-PROFILE_KEEP]: os.remove(old)
+            return path
+        except OSError as e:
+            logger.error(f"Failed to write profile dump: {e}")
+            return None
+
+    def format(self, record: Dict) -> str:
+        stages = ", ".join(f"{stage} {seconds * 1000:.0f}ms" for stage, seconds in sorted(record['stages'].items(), key=lambda i: -i[1]))
+        return f"{record['total'] * 1000:.0f}ms total; {stages or 'no stages recorded'}"
+
+    def slowest(self, limit: int = 10) -> List[Dict]:
+        return sorted(self.recent, key=lambda r: r['total'], reverse=True)[:limit]
+
+update_profiler = UpdateProfiler()
+
+# --- In-Memory Search Index ---
+def _trigrams(text: str) -> frozenset:
+    """Extracts trigrams the way pg_trgm does: lower-cased words padded with two leading and one trailing space."""
+    words = "".join(c if c.isalnum() or unicodedata.category(c).startswith('M') else ' ' for c in text.lower()).split()
+    grams = set()
+    for word in words:
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+class TrigramIndex:
+    """Inverted trigram index over subtitle titles, ranking with pg_trgm's similarity()."""
+
+    def __init__(self):
+        self.entries: Dict[str, tuple] = {}  # unique_id -> (title, year, trigrams)
+        self.postings: Dict[str, set] = {}   # trigram -> unique_ids
+        self.loaded = False
+
+    async def load(self, pool: asyncpg.Pool):
+        rows = await pool.fetch("SELECT unique_id, title, year FROM subtitles")
+        self.entries.clear()
+        self.postings.clear()
+        for row in rows:
+            self.add(row['unique_id'], row['title'], row['year'])
+        self.loaded = True
+        logger.info(f"Search index loaded with {len(self.entries)} titles and {len(self.postings)} trigrams.")
+
+    def add(self, unique_id: str, title: Optional[str], year: Optional[int]):
+        self.remove(unique_id)
+        grams = _trigrams(_normalize_title(title))
+        self.entries[unique_id] = (title, year, grams)
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(unique_id)
+
+    def remove(self, unique_id: str):
+        if not (entry := self.entries.pop(unique_id, None)): return
+        for gram in entry[2]:
+            if (ids := self.postings.get(gram)) is not None:
+                ids.discard(unique_id)
+                if not ids: del self.postings[gram]
+
+    def search(self, text: str, year: Optional[int] = None, limit: int = SEARCH_LIMIT) -> List[Dict]:
+        query = _trigrams(text)
+        if not query: return []
+        overlap: Dict[str, int] = {}
+        for gram in query:
+            for unique_id in self.postings.get(gram, ()):
+                overlap[unique_id] = overlap.get(unique_id, 0) + 1
+
+        results = []
+        for unique_id, shared in overlap.items():
+            title, entry_year, grams = self.entries[unique_id]
+            if year and entry_year != year: continue
+            score = shared / (len(query) + len(grams) - shared)
+            if score > SEARCH_SIMILARITY_THRESHOLD:
+                results.append({'unique_id': unique_id, 'title': title, 'year': entry_year, 'score': score})
+        results.sort(key=lambda r: r['score'], reverse=True)
+        return results[:limit]
+
+search_index = TrigramIndex()
+
+async def reload_search_index():
+    if SEARCH_ENGINE != 'memory' or not db_pool: return
+    try:
+        await search_index.load(db_pool)
+    except Exception as e:
+        logger.error(f"Failed to load search index, falling back to SQL search: {e}")
+        search_index.loaded = False
 
 # --- Menu Messages ---
 WELCOME_MESSAGE = "**🎬 Welcome to Malayalam Subtitle Search Bot!**\n\nYour one-stop destination for high-quality Malayalam subtitles for movies and TV shows."
@@ -46,44 +361,76 @@ AHELP_MESSAGE = """
 - `/scpr`: Open the admin scraper panel to add, remove, or rescrape entries.
 - `/add <url>`: Manually add or update a subtitle from a malayalamsubtitles.org URL.
 - `/broadcast`: Reply to a message with this command to broadcast it to all users.
+- `/profile on [rate] [threshold]` / `/profile off`: Toggle slow-update profiling.
+- `/slow`: List the slowest recently profiled updates with a per-stage breakdown.
 - `/ahelp`: Show this help message.
 """
 
 # --- Self-Contained Scraper Logic (from scraper.py) ---
-def _get_soup(url: str) -> Optional[BeautifulSoup]:
+async def _fetch_html(url: str) -> Optional[str]:
     try:
         headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'}
-        response = requests.get(url, headers=headers, timeout=20)
-        response.raise_for_status()
-        return BeautifulSoup(response.text, 'html.parser')
-    except requests.RequestException as e:
+        session = await get_http_session()
+        async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=20)) as resp:
+            resp.raise_for_status()
+            return await resp.text()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         logger.error(f"Scraper failed to fetch {url}: {e}")
         return None
 
-def _clean_text(text: str) -> str: return re.sub(r'\s+', ' ', text.strip()) if text else ""
-def _extract_imdb_id(url: str) -> Optional[str]: return match.group(0) if (match := re.search(r'tt\d+', url or "")) else None
-def _extract_year(title: str) -> Optional[str]: return match.group(1) if (match := re.search(r'\((\d{4})\)', title)) else None
+try:
+    import lxml  # noqa: F401
+    _FAST_HTML_PARSER = 'lxml'
+except ImportError:
+    _FAST_HTML_PARSER = 'html.parser'
+_WHITESPACE_RE = re.compile(r'\s+')
+_IMDB_ID_RE = re.compile(r'tt\d+')
+_YEAR_RE = re.compile(r'\((\d{4})\)')
+_SEASON_RES = [re.compile(p, re.IGNORECASE) for p in (r'Season\s*(\d+)', r'സീസൺ\s*(\d+)', r'S0?(\d+)', r'സീസണ്‍\s*(\d+)')]
+_SEASON_KEYWORDS = ('season', 'series', 'സീസൺ', 'സീസണ്‍')
+
+def _clean_text(text: str) -> str: return _WHITESPACE_RE.sub(' ', text.strip()) if text else ""
+def _extract_imdb_id(url: str) -> Optional[str]: return match.group(0) if (match := _IMDB_ID_RE.search(url or "")) else None
+def _extract_year(title: str) -> Optional[str]: return match.group(1) if (match := _YEAR_RE.search(title)) else None
+
+def _normalize_title(title: str) -> str:
+    """Lower-cases a title, drops its "(YYYY)" year and punctuation, and collapses whitespace. Mirrors scraper.normalize_title."""
+    title = _YEAR_RE.sub(' ', title or "").lower()
+    return " ".join("".join(c if c.isalnum() or unicodedata.category(c).startswith('M') else ' ' for c in title).split())
+
+def _parse_search_query(text: str) -> tuple:
+    """Splits a trailing year off a search query, e.g. "Dune 2021" -> ("dune", 2021)."""
+    match = re.match(r'^(.*?)[\s(]+((?:18|19|20)\d{2})\)?$', text.strip())
+    if match and _normalize_title(match.group(1)) and int(match.group(2)) <= datetime.now().year + 1:
+        return _normalize_title(match.group(1)), int(match.group(2))
+    return _normalize_title(text), None
 
 def _extract_season_info(title: str) -> Dict[str, Any]:
-    patterns = [r'Season\s*(\d+)', r'സീസൺ\s*(\d+)', r'S0?(\d+)', r'സീസണ്‍\s*(\d+)']
-
-    for pattern in patterns:
-        match = re.search(pattern, title, re.IGNORECASE)
-        if match:
+    for pattern in _SEASON_RES:
+        if match := pattern.search(title):
             series_name = title[:match.start()].strip()
             season_number = int(match.group(1))
             return {'is_series': True, 'season_number': season_number, 'series_name': series_name}
 
-    if any(keyword in title.lower() for keyword in ['season', 'series', 'സീസൺ', 'സീസണ്‍']):
+    if any(keyword in title.lower() for keyword in _SEASON_KEYWORDS):
         return {'is_series': True, 'season_number': 1, 'series_name': title}
 
     return {'is_series': False, 'season_number': None, 'series_name': None}
 
-def scrape_page_details(url: str) -> Optional[Dict]:
+async def scrape_page_details(url: str) -> Optional[Dict]:
     """Scrapes comprehensive details from a movie/series page, handling multiple layouts."""
-    soup = _get_soup(url)
-    if not soup: return None
+    html = await _fetch_html(url)
+    if not html: return None
+    # Parsing is CPU-bound, so keep it off the event loop.
+    return await asyncio.to_thread(parse_page_details, html, url)
+
+def _make_soup(html: str, fast: bool = FAST_HTML_PARSE) -> BeautifulSoup:
+    # Always the whole document: a[href*="imdb.com"] and friends pick the first match on the page.
+    return BeautifulSoup(html, _FAST_HTML_PARSER if fast else 'html.parser')
+
+def parse_page_details(html: str, url: str, fast: bool = FAST_HTML_PARSE) -> Optional[Dict]:
     try:
+        soup = _make_soup(html, fast)
         details = {'source_url': url}
 
         # --- Universal Fields ---
@@ -158,6 +505,9 @@ async def remove_subtitle(unique_id: str) -> bool:
     if not db_pool: return False
     try:
         result = await db_pool.execute("DELETE FROM subtitles WHERE unique_id = $1", unique_id)
+        await db_pool.execute("DELETE FROM subtitle_files WHERE unique_id = $1", unique_id)
+        search_cache.clear()
+        search_index.remove(unique_id)
         # "DELETE 1" on success, "DELETE 0" on no-op
         return result.endswith('1')
     except Exception as e:
@@ -172,7 +522,7 @@ async def rescrape_subtitle(unique_id: str) -> bool:
             logger.warning(f"Rescrape failed: No source_url found for {unique_id}")
             return False
 
-        if details := scrape_page_details(record['source_url']):
+        if details := await scrape_page_details(record['source_url']):
             await upsert_subtitle(details)
             logger.info(f"Successfully rescraped and updated {unique_id}")
             return True
@@ -186,9 +536,29 @@ async def rescrape_subtitle(unique_id: str) -> bool:
 async def init_db():
     global db_pool
     try:
-        db_pool = await asyncpg.create_pool(DATABASE_URL)
+        # The '%' operator uses this threshold instead of a per-row similarity() call, so it can use the trigram index.
+        # As a startup setting it is the session default, so it survives the RESET ALL asyncpg runs on every release.
+        db_pool = await asyncpg.create_pool(DATABASE_URL, server_settings={'pg_trgm.similarity_threshold': str(SEARCH_SIMILARITY_THRESHOLD)})
         async with db_pool.acquire() as conn:
             await conn.execute("CREATE TABLE IF NOT EXISTS users (user_id BIGINT PRIMARY KEY);")
+            await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS blocked_at TIMESTAMPTZ;")
+            await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS last_seen TIMESTAMPTZ;")
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS broadcasts (
+                    id SERIAL PRIMARY KEY,
+                    owner_id BIGINT,
+                    from_chat_id BIGINT,
+                    message_id BIGINT,
+                    progress_message_id BIGINT,
+                    status TEXT DEFAULT 'running',
+                    last_user_id BIGINT DEFAULT 0,
+                    sent INTEGER DEFAULT 0,
+                    failed INTEGER DEFAULT 0,
+                    pruned INTEGER DEFAULT 0,
+                    created_at TIMESTAMPTZ DEFAULT now(),
+                    updated_at TIMESTAMPTZ DEFAULT now()
+                );
+            """)
             await conn.execute("""
                 CREATE TABLE IF NOT EXISTS subtitles (
                     unique_id TEXT PRIMARY KEY,
@@ -218,10 +588,84 @@ async def init_db():
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_subtitles_imdb_id ON subtitles (imdb_id);")
             await conn.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_subtitles_title_trgm ON subtitles USING gin (title gin_trgm_ops);")
+            await conn.execute("ALTER TABLE subtitles ADD COLUMN IF NOT EXISTS search_title TEXT;")
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_subtitles_search_title_trgm ON subtitles USING gin (search_title gin_trgm_ops);")
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_subtitles_year ON subtitles (year);")
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_subtitles_source_url ON subtitles (source_url);")
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS subtitle_files (
+                    unique_id TEXT,
+                    filename TEXT,
+                    position INTEGER,
+                    file_id TEXT,
+                    caption TEXT,
+                    srt_url TEXT,
+                    created_at TIMESTAMPTZ DEFAULT now(),
+                    PRIMARY KEY (unique_id, filename)
+                );
+            """)
+            await conn.execute("ALTER TABLE subtitle_files ADD COLUMN IF NOT EXISTS file_count INTEGER;")
+            await conn.execute("ALTER TABLE subtitles ADD COLUMN IF NOT EXISTS details_text TEXT;")
+            await conn.execute("ALTER TABLE subtitles ADD COLUMN IF NOT EXISTS poster_file_id TEXT;")
+            await conn.execute("ALTER TABLE subtitles ADD COLUMN IF NOT EXISTS poster_file_url TEXT;")
+            await backfill_search_titles(conn)
+            await backfill_details_text(conn)
         logger.info("Database connection pool initialized.")
     except Exception as e:
         logger.critical(f"Database initialization failed: {e}")
         db_pool = None
+        return
+    await init_db_listener()
+
+async def backfill_search_titles(conn: asyncpg.Connection):
+    rows = await conn.fetch("SELECT unique_id, title FROM subtitles WHERE search_title IS NULL")
+    if not rows: return
+    await conn.executemany("UPDATE subtitles SET search_title = $2 WHERE unique_id = $1", [(r['unique_id'], _normalize_title(r['title'])) for r in rows])
+    logger.info(f"Backfilled search_title for {len(rows)} entries.")
+
+def _on_subtitles_changed(conn, pid, channel, payload):
+    logger.info(f"Received {channel} notification ({payload}), clearing search cache.")
+    search_cache.clear()
+    if search_index.loaded:
+        asyncio.create_task(reload_search_index())
+
+async def init_db_listener():
+    global db_listen_conn
+    try:
+        db_listen_conn = await asyncpg.connect(DATABASE_URL)
+        await db_listen_conn.add_listener(SUBTITLES_CHANNEL, _on_subtitles_changed)
+        logger.info(f"Listening for {SUBTITLES_CHANNEL} notifications.")
+    except Exception as e:
+        logger.error(f"Failed to LISTEN on {SUBTITLES_CHANNEL}, search cache will rely on TTL only: {e}")
+        db_listen_conn = None
+
+async def search_subtitles(text: str) -> List:
+    query_text, year = _parse_search_query(text)
+    if not query_text: return []
+    results = await _search_subtitles(query_text, year)
+    if year and not results:
+        # A number that looked like a year may be part of the title, so retry without the filter.
+        results = await _search_subtitles(_normalize_title(text), None)
+    return results
+
+async def _search_subtitles(query_text: str, year: Optional[int]) -> List:
+    if search_index.loaded:
+        return search_index.search(query_text, year)
+    key = (query_text, year)
+    if (results := search_cache.get(key)) is not None:
+        return results
+    year_filter = "AND year = $2" if year else ""
+    query = f"""
+        SELECT unique_id, title, year, similarity(search_title, $1) AS score
+        FROM subtitles
+        WHERE search_title % $1 {year_filter}
+        ORDER BY score DESC
+        LIMIT {SEARCH_LIMIT}
+    """
+    with SQL_LATENCY.time('search'):
+        results = await db_pool.fetch(query, query_text, *([year] if year else []))
+    search_cache.set(key, results)
+    return results
 
 async def upsert_subtitle(details: dict):
     if not db_pool or not details.get('imdb_id'): return
@@ -251,6 +695,7 @@ async def upsert_subtitle(details: dict):
         'msone_release': json.dumps(details.get('msone_release')) if details.get('msone_release') else None,
         'certification': json.dumps(details.get('certification')) if details.get('certification') else None,
         'poster_maker': json.dumps(details.get('poster_maker')) if details.get('poster_maker') else None,
+        'search_title': _normalize_title(details.get('title')),
     }
 
     query = """
@@ -258,9 +703,9 @@ async def upsert_subtitle(details: dict):
             unique_id, imdb_id, source_url, scraped_at, title, year, is_series,
             season_number, series_name, total_seasons, srt_url, poster_url, imdb_url,
             description, director, genre, language, translator, imdb_rating,
-            msone_release, certification, poster_maker
+            msone_release, certification, poster_maker, search_title
         ) VALUES (
-            $1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, $15, $16, $17, $18, $19, $20, $21, $22
+            $1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, $15, $16, $17, $18, $19, $20, $21, $22, $23
         )
         ON CONFLICT (unique_id) DO UPDATE SET
             source_url = EXCLUDED.source_url, scraped_at = EXCLUDED.scraped_at, title = EXCLUDED.title,
@@ -269,24 +714,151 @@ async def upsert_subtitle(details: dict):
             imdb_url = EXCLUDED.imdb_url, description = EXCLUDED.description, director = EXCLUDED.director,
             genre = EXCLUDED.genre, language = EXCLUDED.language, translator = EXCLUDED.translator,
             imdb_rating = EXCLUDED.imdb_rating, msone_release = EXCLUDED.msone_release,
-            certification = EXCLUDED.certification, poster_maker = EXCLUDED.poster_maker;
+            certification = EXCLUDED.certification, poster_maker = EXCLUDED.poster_maker,
+            search_title = EXCLUDED.search_title
+        RETURNING *;
     """
-    await db_pool.execute(query, *db_record.values())
-
-async def add_user(user_id: int):
+    with SQL_LATENCY.time('upsert'):
+        row = await db_pool.fetchrow(query, *db_record.values())
+    await store_details_text(unique_id, render_details_text(row))
+    # Uploaded file_ids belong to the old archive once the download link changes.
+    await db_pool.execute("DELETE FROM subtitle_files WHERE unique_id = $1 AND srt_url IS DISTINCT FROM $2", unique_id, db_record['srt_url'])
+    search_cache.clear()
+    if search_index.loaded:
+        search_index.add(unique_id, db_record['title'], db_record['year'])
+
+async def fetch_subtitle(unique_id: str) -> Optional[asyncpg.Record]:
+    with SQL_LATENCY.time('view'):
+        return await db_pool.fetchrow("SELECT * FROM subtitles WHERE unique_id = $1", unique_id)
+
+async def store_details_text(unique_id: str, details_text: str):
+    try:
+        await db_pool.execute("UPDATE subtitles SET details_text = $2 WHERE unique_id = $1", unique_id, details_text)
+    except Exception as e:
+        logger.error(f"Failed to store details card for {unique_id}: {e}")
+
+async def backfill_details_text(conn: asyncpg.Connection):
+    rows = await conn.fetch("SELECT * FROM subtitles WHERE details_text IS NULL")
+    if not rows: return
+    await conn.executemany("UPDATE subtitles SET details_text = $2 WHERE unique_id = $1", [(r['unique_id'], render_details_text(r)) for r in rows])
+    logger.info(f"Rendered details cards for {len(rows)} entries.")
+
+async def send_poster(entry: asyncpg.Record, chat_id: str) -> Optional[int]:
+    """Sends the poster, by cached file_id when it still matches poster_url. Returns the message_id."""
+    if not entry.get('poster_url'): return None
+    payload = {'method': 'sendPhoto', 'chat_id': chat_id, 'caption': f"**{entry['title']}**", 'parse_mode': 'Markdown'}
+    cached = entry.get('poster_file_id') and entry.get('poster_file_url') == entry['poster_url']
+    photo_response = await send_telegram_message({**payload, 'photo': entry['poster_file_id'] if cached else entry['poster_url']})
+    if cached and not photo_response.get('ok'):
+        # The file_id may have been invalidated; fall back to letting Telegram fetch the URL.
+        cached = False
+        photo_response = await send_telegram_message({**payload, 'photo': entry['poster_url']})
+    if not (photo_response and photo_response.get('ok')): return None
+
+    if not cached and (sizes := photo_response['result'].get('photo')):
+        try:
+            await db_pool.execute("UPDATE subtitles SET poster_file_id = $2, poster_file_url = $3 WHERE unique_id = $1", entry['unique_id'], sizes[-1]['file_id'], entry['poster_url'])
+        except Exception as e:
+            logger.error(f"Failed to cache poster file_id for {entry['unique_id']}: {e}")
+    return photo_response['result']['message_id']
+
+def add_user(user_id: int):
+    """Records that a user was seen; new users and last_seen times are written by flush_users."""
+    global new_user_count
+    if user_id not in known_user_ids:
+        known_user_ids.add(user_id)
+        new_user_count += 1
+    seen_users[user_id] = datetime.now()
+
+async def load_known_users():
     if not db_pool: return
     try:
-        await db_pool.execute("INSERT INTO users (user_id) VALUES ($1) ON CONFLICT (user_id) DO NOTHING;", user_id)
+        known_user_ids.update(r['user_id'] for r in await db_pool.fetch("SELECT user_id FROM users"))
+        logger.info(f"Loaded {len(known_user_ids)} known users.")
     except Exception as e:
-        logger.error(f"Failed to add user {user_id}: {e}")
+        logger.error(f"Failed to load known users: {e}")
 
-async def check_user_membership(user_id: int) -> bool:
+async def flush_users():
+    global seen_users, new_user_count
+    if not db_pool or not seen_users: return
+    batch, seen_users = seen_users, {}
+    new_users, new_user_count = new_user_count, 0
+    try:
+        # A blocked user who writes to the bot again has unblocked it.
+        await db_pool.execute("""
+            INSERT INTO users (user_id, last_seen)
+            SELECT * FROM unnest($1::bigint[], $2::timestamptz[])
+            ON CONFLICT (user_id) DO UPDATE SET
+                last_seen = GREATEST(users.last_seen, EXCLUDED.last_seen), blocked_at = NULL;
+        """, list(batch.keys()), list(batch.values()))
+        if new_users: logger.info(f"Registered {new_users} new users.")
+    except Exception as e:
+        logger.error(f"Failed to flush {len(batch)} users: {e}")
+        new_user_count += new_users
+        for user_id, seen_at in batch.items():
+            seen_users.setdefault(user_id, seen_at)
+
+async def user_flush_loop():
+    while True:
+        await asyncio.sleep(USER_FLUSH_INTERVAL)
+        await flush_users()
+
+async def check_user_membership(user_id: int, refresh: bool = False) -> bool:
     if not FORCE_SUB_CHANNEL_ID: return True
+    if refresh:
+        membership_cache.pop(user_id)
+    elif (is_member := membership_cache.get(user_id)) is not None:
+        return is_member
     try:
         member = await send_telegram_message({'method': 'getChatMember', 'chat_id': FORCE_SUB_CHANNEL_ID, 'user_id': user_id})
-        return member.get('result', {}).get('status') not in ['left', 'kicked']
+        is_member = member.get('result', {}).get('status') not in ['left', 'kicked']
+        if member.get('ok'):
+            membership_cache.set(user_id, is_member, MEMBERSHIP_TTL if is_member else MEMBERSHIP_NEGATIVE_TTL)
+        return is_member
     except Exception: return False
 
+# --- Admin Job Queue ---
+async def submit_admin_job(owner_id: int, kind: str, value: str) -> int:
+    """Queues an admin scrape job ('add' or 'rescrape') and returns its position in the queue."""
+    await admin_job_queue.put((kind, value, owner_id))
+    return admin_job_queue.qsize()
+
+async def run_admin_job(kind: str, value: str) -> str:
+    if kind == 'add':
+        if details := await scrape_page_details(value):
+            await upsert_subtitle(details)
+            return f"✅ Added/Updated: **{details.get('title', value)}**"
+        return f"❌ Failed to scrape or add entry for URL: {value}"
+    if kind == 'rescrape':
+        if await rescrape_subtitle(value):
+            return f"✅ Entry `{value}` has been successfully rescraped."
+        return f"❌ Failed to rescrape entry `{value}`."
+    return f"❌ Unknown job type `{kind}`."
+
+async def admin_job_worker():
+    while True:
+        kind, value, owner_id = await admin_job_queue.get()
+        started = time.monotonic()
+        try:
+            result_text = await run_admin_job(kind, value)
+        except Exception as e:
+            logger.exception(f"Admin job {kind} failed for {value}")
+            result_text = f"❌ Job `{kind}` failed for `{value}`: {e}"
+        finally:
+            admin_job_queue.task_done()
+        elapsed = time.monotonic() - started
+        await send_telegram_message({'chat_id': owner_id, 'text': f"{result_text}\n\n⏱️ Took {elapsed:.1f}s", 'parse_mode': 'Markdown'})
+
+def start_admin_job_workers():
+    global admin_job_queue
+    admin_job_queue = asyncio.Queue()
+    admin_job_workers.extend(asyncio.create_task(admin_job_worker()) for _ in range(ADMIN_JOB_WORKERS))
+
+async def stop_admin_job_workers():
+    for task in admin_job_workers: task.cancel()
+    await asyncio.gather(*admin_job_workers, return_exceptions=True)
+    admin_job_workers.clear()
+
 # --- Formatting & Keyboards ---
 def create_menu_keyboard(current: str) -> Dict:
     buttons = [{'text': "About", 'callback_data': 'menu_about'}, {'text': "Help", 'callback_data': 'menu_help'}]
@@ -314,6 +886,42 @@ def create_detail_keyboard(entry: asyncpg.Record, photo_msg_id: Optional[int] =
     keyboard.append([{'text': 'Close', 'callback_data': close_callback}])
     return {'inline_keyboard': keyboard}
 
+def _format_json_field(data: Optional[str]) -> str:
+    if not data: return "N/A"
+    try:
+        field_data = json.loads(data)
+        return field_data.get('name', 'N/A')
+    except (json.JSONDecodeError, AttributeError):
+        return str(data) if data else "N/A"
+
+def render_details_text(entry: asyncpg.Record) -> str:
+    """Renders the Markdown details card for an entry. Stored in subtitles.details_text."""
+    details_parts = []
+    if msone := _format_json_field(entry.get('msone_release')):
+         if msone != "N/A": details_parts.append(f"**MSone Release:** `{msone}`")
+    if director := _format_json_field(entry.get('director')):
+        if director != "N/A": details_parts.append(f"**Director:** {director}")
+    if lang := _format_json_field(entry.get('language')):
+        if lang != "N/A": details_parts.append(f"**Language:** {lang}")
+    if genre := _format_json_field(entry.get('genre')):
+        if genre != "N/A": details_parts.append(f"**Genre:** {genre}")
+    if rating := _format_json_field(entry.get('imdb_rating')):
+        if rating != "N/A": details_parts.append(f"**IMDb Rating:** {rating}")
+    if cert := _format_json_field(entry.get('certification')):
+        if cert != "N/A": details_parts.append(f"**Certification:** {cert}")
+    if translator := _format_json_field(entry.get('translator')):
+        if translator != "N/A": details_parts.append(f"**Translated By:** {translator}")
+
+    if entry.get('is_series'):
+        details_parts.append(f"**Season:** {entry.get('season_number', 'N/A')}")
+        if entry.get('total_seasons'):
+            details_parts.append(f"**Total Seasons:** {entry['total_seasons']}")
+
+    if description := entry.get('description'):
+        details_parts.append(f"\n**Synopsis:**\n{description}")
+
+    return "\n".join(details_parts)
+
 def create_scraper_panel_keyboard() -> Dict:
     buttons = [
         {'text': "Add", 'callback_data': 'scpr_add'},
@@ -323,6 +931,23 @@ def create_scraper_panel_keyboard() -> Dict:
     ]
     return {'inline_keyboard': [buttons, [{'text': 'Close', 'callback_data': 'menu_close'}]]}
 
+# Telegram error descriptions for chats that will never accept a message again.
+DEAD_CHAT_ERRORS = ('bot was blocked', 'chat not found', 'user is deactivated', 'bot was kicked', 'bot can\'t initiate conversation')
+
+def _is_dead_chat(response: Any) -> bool:
+    if not isinstance(response, dict) or response.get('ok'): return False
+    description = response.get('description', '').lower()
+    return any(error in description for error in DEAD_CHAT_ERRORS)
+
+def _broadcast_report(job: Dict, done: bool) -> str:
+    title = "**Broadcast Complete**" if done else "**Broadcast In Progress...**"
+    return (
+        f"{title}\n\n"
+        f"✅ **Sent to:** {job['sent']} users\n"
+        f"❌ **Failed for:** {job['failed']} users\n"
+        f"🚫 **Blocked/removed:** {job['pruned']} users"
+    )
+
 async def run_broadcast(message: dict):
     owner_id = message['from']['id']
     replied_message = message['reply_to_message']
@@ -331,40 +956,153 @@ async def run_broadcast(message: dict):
         await send_telegram_message({'chat_id': owner_id, 'text': "Database not connected. Broadcast aborted."})
         return
 
-    users = await db_pool.fetch("SELECT user_id FROM users")
-    if not users:
+    if not await db_pool.fetchval("SELECT EXISTS (SELECT 1 FROM users WHERE blocked_at IS NULL)"):
         await send_telegram_message({'chat_id': owner_id, 'text': "No users in database to broadcast to."})
         return
 
-    tasks = []
-    for user in users:
-        task = send_telegram_message({
+    progress = await send_telegram_message({'chat_id': owner_id, 'text': "**Broadcast In Progress...**", 'parse_mode': 'Markdown'})
+    job = await db_pool.fetchrow("""
+        INSERT INTO broadcasts (owner_id, from_chat_id, message_id, progress_message_id)
+        VALUES ($1, $2, $3, $4) RETURNING *
+    """, owner_id, replied_message['chat']['id'], replied_message['message_id'], progress.get('result', {}).get('message_id'))
+    await run_broadcast_job(dict(job))
+
+async def run_broadcast_job(job: Dict):
+    """Sends a broadcast in keyset-ordered batches of users, checkpointing after each batch so it can resume."""
+    logger.info(f"Running broadcast {job['id']} from user_id > {job['last_user_id']}")
+    last_progress = time.monotonic()
+    while True:
+        users = await db_pool.fetch(
+            "SELECT user_id FROM users WHERE user_id > $1 AND blocked_at IS NULL ORDER BY user_id LIMIT $2",
+            job['last_user_id'], BROADCAST_BATCH_SIZE
+        )
+        if not users: break
+
+        results = await asyncio.gather(*(send_telegram_message({
             'method': 'copyMessage',
             'chat_id': user['user_id'],
-            'from_chat_id': replied_message['chat']['id'],
-            'message_id': replied_message['message_id']
-        })
-        tasks.append(task)
-        await asyncio.sleep(0.05)  # To avoid hitting API rate limits
-
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-
-    success_count = sum(1 for r in results if isinstance(r, dict) and r.get('ok'))
-    failed_count = len(results) - success_count
-
-    report_text = (
-        f"**Broadcast Complete**\n\n"
-        f"✅ **Sent to:** {success_count} users\n"
-        f"❌ **Failed for:** {failed_count} users"
-    )
-
+            'from_chat_id': job['from_chat_id'],
+            'message_id': job['message_id']
+        }, priority=PRIORITY_BULK) for user in users), return_exceptions=True)
+
+        dead_users = [user['user_id'] for user, result in zip(users, results) if _is_dead_chat(result)]
+        sent = sum(1 for r in results if isinstance(r, dict) and r.get('ok'))
+        job['sent'] += sent
+        job['failed'] += len(results) - sent
+        job['pruned'] += len(dead_users)
+        job['last_user_id'] = users[-1]['user_id']
+
+        async with db_pool.acquire() as conn, conn.transaction():
+            if dead_users:
+                await conn.execute("UPDATE users SET blocked_at = now() WHERE user_id = ANY($1::bigint[])", dead_users)
+            await conn.execute(
+                "UPDATE broadcasts SET last_user_id = $2, sent = $3, failed = $4, pruned = $5, updated_at = now() WHERE id = $1",
+                job['id'], job['last_user_id'], job['sent'], job['failed'], job['pruned']
+            )
+
+        if job['progress_message_id'] and time.monotonic() - last_progress >= BROADCAST_PROGRESS_INTERVAL:
+            last_progress = time.monotonic()
+            await send_telegram_message({'method': 'editMessageText', 'chat_id': job['owner_id'], 'message_id': job['progress_message_id'], 'text': _broadcast_report(job, False), 'parse_mode': 'Markdown'}, priority=PRIORITY_BULK)
+
+    await db_pool.execute("UPDATE broadcasts SET status = 'done', updated_at = now() WHERE id = $1", job['id'])
+    logger.info(f"Broadcast {job['id']} complete: {job['sent']} sent, {job['failed']} failed, {job['pruned']} pruned.")
+
+    if job['progress_message_id']:
+        await send_telegram_message({'method': 'deleteMessage', 'chat_id': job['owner_id'], 'message_id': job['progress_message_id']})
     await send_telegram_message({
-        'chat_id': owner_id,
-        'text': report_text,
+        'chat_id': job['owner_id'],
+        'text': _broadcast_report(job, True),
         'parse_mode': 'Markdown',
         'reply_markup': {'inline_keyboard': [[{'text': '❌ Close', 'callback_data': 'menu_close'}]]}
     })
 
+def start_broadcast_task(coro) -> asyncio.Task:
+    task = spawn_background(coro)
+    broadcast_tasks.add(task)
+    task.add_done_callback(broadcast_tasks.discard)
+    return task
+
+async def resume_broadcasts():
+    if not db_pool: return
+    try:
+        jobs = await db_pool.fetch("SELECT * FROM broadcasts WHERE status = 'running' ORDER BY id")
+    except Exception as e:
+        logger.error(f"Failed to load unfinished broadcasts: {e}")
+        return
+    for job in jobs:
+        logger.info(f"Resuming broadcast {job['id']} after user_id {job['last_user_id']}")
+        start_broadcast_task(run_broadcast_job(dict(job)))
+
+async def stop_broadcasts():
+    # Progress is checkpointed per batch, so interrupted jobs resume on the next startup.
+    for task in list(broadcast_tasks): task.cancel()
+    await asyncio.gather(*broadcast_tasks, return_exceptions=True)
+
+def _uploaded_file_id(upload_response: dict) -> Optional[str]:
+    return (upload_response or {}).get('result', {}).get('document', {}).get('file_id')
+
+async def remember_file_ids(unique_id: str, srt_url: str, files: List[tuple]):
+    """Caches the file_ids of a complete upload, given as (position, filename, caption, file_id) for every file."""
+    try:
+        async with db_pool.acquire() as conn, conn.transaction():
+            await conn.execute("DELETE FROM subtitle_files WHERE unique_id = $1", unique_id)
+            await conn.executemany("""
+                INSERT INTO subtitle_files (unique_id, filename, position, file_id, caption, srt_url, file_count)
+                VALUES ($1, $2, $3, $4, $5, $6, $7)
+            """, [(unique_id, filename, position, file_id, caption, srt_url, len(files)) for position, filename, caption, file_id in files])
+    except Exception as e:
+        logger.error(f"Failed to cache file_ids for {unique_id}: {e}")
+
+async def send_cached_files(unique_id: str, srt_url: str, chat_id: str) -> tuple:
+    """Re-sends previously uploaded documents by file_id.
+
+    Returns (done, delivered): done is False if the origin must be fetched, and delivered maps the filenames
+    already sent in this call to their file_ids so that download can skip them.
+    """
+    # The srt_url match also ignores file_ids left over from a link the scraper has since changed.
+    cached = await db_pool.fetch("SELECT filename, file_id, caption, file_count FROM subtitle_files WHERE unique_id = $1 AND srt_url = $2 ORDER BY position", unique_id, srt_url)
+    # Rows are only usable as the complete set; older caches without file_count may be missing files.
+    if not cached or any(record['file_count'] != len(cached) for record in cached): return False, {}
+
+    delivered = {}
+    for record in cached:
+        payload = {'method': 'sendDocument', 'chat_id': chat_id, 'document': record['file_id']}
+        if record['caption']: payload['caption'] = record['caption']
+        response = await send_telegram_message(payload)
+        if not response.get('ok'):
+            logger.warning(f"Cached file_id for {unique_id}/{record['filename']} was rejected, fetching the rest from origin.")
+            await db_pool.execute("DELETE FROM subtitle_files WHERE unique_id = $1", unique_id)
+            return False, delivered
+        delivered[record['filename']] = record['file_id']
+    logger.info(f"Sent {len(cached)} cached file(s) for {unique_id}.")
+    return True, delivered
+
+async def _download_to_spool(url: str) -> Optional[tempfile.SpooledTemporaryFile]:
+    """Streams a download into a spooled temp file, refusing anything over DOWNLOAD_MAX_BYTES."""
+    headers = {'User-Agent': 'Mozilla/5.0'}
+    session = await get_http_session()
+    async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=DOWNLOAD_TIMEOUT)) as resp:
+        logger.info(f"Download response status: {resp.status}")
+        if resp.status != 200:
+            return None
+        if resp.content_length and resp.content_length > DOWNLOAD_MAX_BYTES:
+            raise ValueError(f"Download of {resp.content_length} bytes exceeds the {DOWNLOAD_MAX_BYTES} byte limit")
+
+        spool = tempfile.SpooledTemporaryFile(max_size=DOWNLOAD_SPOOL_MEMORY)
+        size = 0
+        try:
+            async for chunk in resp.content.iter_chunked(64 * 1024):
+                size += len(chunk)
+                if size > DOWNLOAD_MAX_BYTES:
+                    raise ValueError(f"Download exceeded the {DOWNLOAD_MAX_BYTES} byte limit")
+                spool.write(chunk)
+        except Exception:
+            spool.close()
+            raise
+    logger.info(f"Successfully downloaded {size} bytes.")
+    spool.seek(0)
+    return spool
+
 async def process_download(unique_id: str, chat_id: str):
     logger.info(f"Starting download process for unique_id: {unique_id}")
     if not db_pool:
@@ -379,56 +1117,101 @@ async def process_download(unique_id: str, chat_id: str):
 
     logger.info(f"Found srt_url: {entry['srt_url']}")
 
+    global downloads_waiting
     try:
-        logger.info(f"Attempting to download file from {entry['srt_url']}")
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        async with aiohttp.ClientSession() as session:
-            async with session.get(entry['srt_url'], headers=headers) as resp:
-                logger.info(f"Download response status: {resp.status}")
-                if resp.status != 200:
-                    await send_telegram_message({'chat_id': chat_id, 'text': "Sorry, I couldn't download the file."})
-                    return
-                file_content = await resp.read()
-        logger.info(f"Successfully downloaded {len(file_content)} bytes.")
+        done, delivered = await send_cached_files(unique_id, entry['srt_url'], chat_id)
+        if done: return
 
-        # A ZIP file starts with b'PK'. This is more reliable than checking the URL.
-        if file_content.startswith(b'PK'):
-            logger.info("Detected .zip file by magic bytes. Starting extraction.")
-            with io.BytesIO(file_content) as zip_buffer:
-                with zipfile.ZipFile(zip_buffer) as zip_file:
-                    count = 0
-                    for file_info in zip_file.infolist():
-                        if file_info.is_dir() or not file_info.filename.lower().endswith('.srt'):
-                            continue
+        if download_semaphore.locked():
+            downloads_waiting += 1
+            await send_telegram_message({'chat_id': chat_id, 'text': f"⏳ Many downloads are in progress. You are #{downloads_waiting} in the queue."})
+            try:
+                await download_semaphore.acquire()
+            finally:
+                downloads_waiting -= 1
+        else:
+            await download_semaphore.acquire()
 
-                        count += 1
-                        filename = file_info.filename
-                        sub_content = zip_file.read(filename)
+        try:
+            await _download_and_upload(unique_id, entry, chat_id, delivered)
+        finally:
+            download_semaphore.release()
 
-                        logger.info(f"Uploading file {count}: {filename} ({len(sub_content)} bytes)")
+    except Exception as e:
+        logger.exception(f"Download processing failed for {unique_id}: {e}")
+        await send_telegram_message({'chat_id': chat_id, 'text': "An error occurred while processing the file."})
+
+async def _download_and_upload(unique_id: str, entry: asyncpg.Record, chat_id: str, delivered: Optional[Dict[str, str]] = None):
+    """Downloads the subtitle and uploads its files, skipping any in `delivered` (filename -> file_id) that the user already has."""
+    delivered = delivered or {}
+    logger.info(f"Attempting to download file from {entry['srt_url']}")
+    started = time.perf_counter()
+    spool = None
+    with track_in_flight('downloads'):
+        try:
+            spool = await _download_to_spool(entry['srt_url'])
+        finally:
+            DOWNLOAD_LATENCY.observe('ok' if spool else 'error', time.perf_counter() - started)
+    if not spool:
+        await send_telegram_message({'chat_id': chat_id, 'text': "Sorry, I couldn't download the file."})
+        return
+
+    files, failed = [], 0 # (position, filename, caption, file_id) of every file in the pack
+    with spool:
+        # A ZIP file starts with b'PK'. This is more reliable than checking the URL.
+        is_zip = spool.read(2) == b'PK'
+        spool.seek(0)
+        if is_zip:
+            logger.info("Detected .zip file by magic bytes. Starting extraction.")
+            with zipfile.ZipFile(spool) as zip_file:
+                count = 0
+                for file_info in zip_file.infolist():
+                    if file_info.is_dir() or not file_info.filename.lower().endswith('.srt'):
+                        continue
+
+                    count += 1
+                    filename = file_info.filename
+                    if file_id := delivered.get(filename):
+                        files.append((count, filename, filename, file_id))
+                        continue
+
+                    logger.info(f"Uploading file {count}: {filename} ({file_info.file_size} bytes)")
+                    # The member is streamed from the archive into the multipart body.
+                    with zip_file.open(file_info) as member:
                         form = aiohttp.FormData()
                         form.add_field('chat_id', chat_id)
-                        form.add_field('document', sub_content, filename=filename, content_type='text/plain')
+                        form.add_field('document', member, filename=filename, content_type='text/plain')
                         form.add_field('caption', filename)
                         upload_response = await send_telegram_message(form)
-                        logger.info(f"Upload response for {filename}: {upload_response}")
-                        await asyncio.sleep(0.5)
-
-                    if count == 0:
-                        logger.warning(f"No .srt files found in zip for {unique_id}")
-                        await send_telegram_message({'chat_id': chat_id, 'text': "Sorry, I couldn't find any subtitle files in that ZIP archive."})
+                    logger.info(f"Upload response for {filename}: {upload_response}")
+                    if file_id := _uploaded_file_id(upload_response):
+                        files.append((count, filename, filename, file_id))
+                    else:
+                        failed += 1
+                    await asyncio.sleep(0.5)
+
+                if count == 0:
+                    logger.warning(f"No .srt files found in zip for {unique_id}")
+                    await send_telegram_message({'chat_id': chat_id, 'text': "Sorry, I couldn't find any subtitle files in that ZIP archive."})
         else:
             logger.info("Detected single file. Preparing for upload.")
             filename = f"{entry['title']}.srt"
             form = aiohttp.FormData()
             form.add_field('chat_id', chat_id)
-            form.add_field('document', file_content, filename=filename, content_type='text/plain')
+            form.add_field('document', spool, filename=filename, content_type='text/plain')
             upload_response = await send_telegram_message(form)
             logger.info(f"Upload response for single file: {upload_response}")
+            if file_id := _uploaded_file_id(upload_response):
+                files.append((0, filename, None, file_id))
+            else:
+                failed += 1
 
-    except Exception as e:
-        logger.exception(f"Download processing failed for {unique_id}: {e}")
-        await send_telegram_message({'chat_id': chat_id, 'text': "An error occurred while processing the file."})
+    if failed:
+        # A partial set is never cached, so the next request uploads the whole pack again.
+        logger.error(f"{failed} file(s) of {unique_id} failed to upload.")
+        await send_telegram_message({'chat_id': chat_id, 'text': f"Sorry, {failed} file(s) couldn't be sent. Please try the download again."})
+    elif files:
+        await remember_file_ids(unique_id, entry['srt_url'], files)
 
 
 # --- Core Handlers ---
@@ -453,62 +1236,19 @@ async def handle_callback_query(callback_query: dict) -> Optional[Dict]:
         if text := text_map.get(value):
             return {'method': 'editMessageText', 'text': text, 'reply_markup': create_menu_keyboard(value), 'parse_mode': 'Markdown', 'chat_id': chat_id, 'message_id': message['message_id']}
 
-    elif action == 'view' and (entry := await db_pool.fetchrow("SELECT * FROM subtitles WHERE unique_id = $1", value)):
-        # First, delete the message that triggered this view (e.g., the search results)
-        await send_telegram_message({'method': 'deleteMessage', 'chat_id': chat_id, 'message_id': message['message_id']})
-
-        def format_json_field(data: Optional[str]) -> str:
-            if not data: return "N/A"
-            try:
-                field_data = json.loads(data)
-                return field_data.get('name', 'N/A')
-            except (json.JSONDecodeError, AttributeError):
-                return str(data) if data else "N/A"
-
-        # --- Message 1: Photo ---
-        photo_msg_id = None
-        if entry.get('poster_url'):
-            photo_payload = {
-                'method': 'sendPhoto',
-                'chat_id': chat_id,
-                'photo': entry['poster_url'],
-                'caption': f"**{entry['title']}**",
-                'parse_mode': 'Markdown'
-            }
-            photo_response = await send_telegram_message(photo_payload)
-            if photo_response and photo_response.get('ok'):
-                photo_msg_id = photo_response['result']['message_id']
-
-        # --- Message 2: Details ---
-        details_parts = []
-        if msone := format_json_field(entry.get('msone_release')):
-             if msone != "N/A": details_parts.append(f"**MSone Release:** `{msone}`")
-        if director := format_json_field(entry.get('director')):
-            if director != "N/A": details_parts.append(f"**Director:** {director}")
-        if lang := format_json_field(entry.get('language')):
-            if lang != "N/A": details_parts.append(f"**Language:** {lang}")
-        if genre := format_json_field(entry.get('genre')):
-            if genre != "N/A": details_parts.append(f"**Genre:** {genre}")
-        if rating := format_json_field(entry.get('imdb_rating')):
-            if rating != "N/A": details_parts.append(f"**IMDb Rating:** {rating}")
-        if cert := format_json_field(entry.get('certification')):
-            if cert != "N/A": details_parts.append(f"**Certification:** {cert}")
-        if translator := format_json_field(entry.get('translator')):
-            if translator != "N/A": details_parts.append(f"**Translated By:** {translator}")
-
-        if entry.get('is_series'):
-            details_parts.append(f"**Season:** {entry.get('season_number', 'N/A')}")
-            if entry.get('total_seasons'):
-                details_parts.append(f"**Total Seasons:** {entry['total_seasons']}")
-
-        if description := entry.get('description'):
-            details_parts.append(f"\n**Synopsis:**\n{description}")
-
+    elif action == 'view' and (entry := await fetch_subtitle(value)):
+        details_text = entry.get('details_text')
+        if details_text is None:
+            details_text = render_details_text(entry)
+            spawn_background(store_details_text(entry['unique_id'], details_text))
         if str(user.get('id')) == OWNER_ID:
-            details_parts.append(f"\n\n**Admin Info:**\n`{entry['unique_id']}`")
+            details_text += f"\n\n**Admin Info:**\n`{entry['unique_id']}`"
 
-        details_text = "\n".join(details_parts)
+        # --- Message 1: Photo, sent while the search results message is deleted ---
+        delete_results = send_telegram_message({'method': 'deleteMessage', 'chat_id': chat_id, 'message_id': message['message_id']})
+        _, photo_msg_id = await asyncio.gather(delete_results, send_poster(entry, chat_id))
 
+        # --- Message 2: Details ---
         # If photo wasn't sent, send all info in one message
         if not photo_msg_id:
             full_caption = f"**{entry['title']}**\n\n{details_text}"
@@ -533,8 +1273,11 @@ async def handle_callback_query(callback_query: dict) -> Optional[Dict]:
 
         return None
 
+    elif action == 'fsub' and value == 'check':
+        return {'method': 'editMessageText', 'text': WELCOME_MESSAGE, 'reply_markup': create_menu_keyboard('home'), 'parse_mode': 'Markdown', 'chat_id': chat_id, 'message_id': message['message_id']}
+
     elif action == 'download':
-        asyncio.create_task(process_download(value, chat_id))
+        spawn_background(process_download(value, chat_id))
         return {'method': 'answerCallbackQuery', 'callback_query_id': callback_query['id'], 'text': "Please wait, preparing your download..."}
 
     elif action == 'scpr' and str(user.get('id')) == OWNER_ID:
@@ -559,12 +1302,21 @@ async def handle_telegram_message(message_data: dict) -> Optional[Dict]:
 
     if not user or not (user_id := user.get('id')): return None
 
-    if not await check_user_membership(user_id):
+    # "I've Joined" skips the cache so a fresh join is picked up immediately.
+    joined_check = message_data.get('callback_query', {}).get('data') == 'fsub_check'
+    with profile_stage('membership'):
+        is_member = await check_user_membership(user_id, refresh=joined_check)
+    if not is_member:
         if 'callback_query' in message_data:
             await send_telegram_message({'method': 'answerCallbackQuery', 'callback_query_id': message_data['callback_query']['id'], 'text': "Please join our channel to use the bot.", 'show_alert': True})
-        return {'chat_id': user_id, 'text': "You must join our channel to use this bot.", 'reply_markup': {'inline_keyboard': [[{'text': "Join Channel", 'url': FORCE_SUB_CHANNEL_LINK}]]}}
+            if joined_check: return None
+        return {'chat_id': user_id, 'text': "You must join our channel to use this bot.", 'reply_markup': {'inline_keyboard': [
+            [{'text': "Join Channel", 'url': FORCE_SUB_CHANNEL_LINK}],
+            [{'text': "✅ I've Joined", 'callback_data': 'fsub_check'}],
+        ]}}
 
-    await add_user(user_id)
+    with profile_stage('add_user'):
+        add_user(user_id)
 
     if 'callback_query' in message_data:
         if response := await handle_callback_query(message_data['callback_query']):
@@ -602,19 +1354,13 @@ async def handle_telegram_message(message_data: dict) -> Optional[Dict]:
     # --- Handle pending admin tasks ---
     if str(user_id) == OWNER_ID and (task := admin_tasks.pop(str(user_id), None)):
         input_value = text
-        if task == 'add':
-            if details := scrape_page_details(input_value):
-                await upsert_subtitle(details)
-                return {'chat_id': user_id, 'text': f"✅ Added/Updated: **{details['title']}**"}
-            return {'chat_id': user_id, 'text': f"❌ Failed to scrape or add entry for URL: {input_value}"}
+        if task in ('add', 'rescrape'):
+            position = await submit_admin_job(user_id, task, input_value)
+            return {'chat_id': user_id, 'text': f"⏳ Queued {task} for `{input_value}` (position {position}). I'll message you when it's done.", 'parse_mode': 'Markdown'}
         elif task == 'remove':
             if await remove_subtitle(input_value):
                 return {'chat_id': user_id, 'text': f"✅ Entry `{input_value}` has been removed."}
             return {'chat_id': user_id, 'text': f"❌ Failed to remove entry `{input_value}`."}
-        elif task == 'rescrape':
-            if await rescrape_subtitle(input_value):
-                return {'chat_id': user_id, 'text': f"✅ Entry `{input_value}` has been successfully rescraped."}
-            return {'chat_id': user_id, 'text': f"❌ Failed to rescrape entry `{input_value}`."}
         elif task == 'view':
             if not db_pool: return {'chat_id': user_id, 'text': "Database not connected."}
             entry = await db_pool.fetchrow("SELECT * FROM subtitles WHERE unique_id = $1", input_value)
@@ -649,81 +1395,379 @@ async def handle_telegram_message(message_data: dict) -> Optional[Dict]:
             if command == '/scpr':
                 return {'chat_id': user_id, 'text': "🛠️ Admin Scraper Panel", 'reply_markup': create_scraper_panel_keyboard()}
 
+            if command == '/profile':
+                if args and args[0] in ('on', 'off'):
+                    update_profiler.enabled = args[0] == 'on'
+                    try:
+                        if len(args) > 1: update_profiler.sample_rate = float(args[1])
+                        if len(args) > 2: update_profiler.slow_threshold = float(args[2])
+                    except ValueError:
+                        return {'chat_id': user_id, 'text': "Usage: /profile on|off [sample_rate] [slow_threshold_seconds]"}
+                state = "on" if update_profiler.enabled else "off"
+                return {'chat_id': user_id, 'text': f"Profiling is {state}: sampling {update_profiler.sample_rate:.1%} of updates, recording all over {update_profiler.slow_threshold}s."}
+
+            if command == '/slow':
+                if not (records := update_profiler.slowest()):
+                    return {'chat_id': user_id, 'text': "No profiled updates yet. Enable profiling with /profile on."}
+                lines = [f"{r['at']:%H:%M:%S} {r['kind']} (update {r['update_id']}): {update_profiler.format(r)}" for r in records]
+                return {'chat_id': user_id, 'text': "Slowest recent updates:\n\n" + "\n\n".join(lines)}
+
             if command == '/stats':
                 if not db_pool: return {'chat_id': user_id, 'text': "Database not connected."}
 
-                total_users = await db_pool.fetchval("SELECT COUNT(*) FROM users")
-                total_entries = await db_pool.fetchval("SELECT COUNT(*) FROM subtitles")
-                movie_count = await db_pool.fetchval("SELECT COUNT(*) FROM subtitles WHERE is_series = false")
-                series_count = await db_pool.fetchval("SELECT COUNT(*) FROM subtitles WHERE is_series = true")
+                await flush_users()
+                with SQL_LATENCY.time('stats'):
+                    total_users = await db_pool.fetchval("SELECT COUNT(*) FROM users")
+                    total_entries = await db_pool.fetchval("SELECT COUNT(*) FROM subtitles")
+                    movie_count = await db_pool.fetchval("SELECT COUNT(*) FROM subtitles WHERE is_series = false")
+                    series_count = await db_pool.fetchval("SELECT COUNT(*) FROM subtitles WHERE is_series = true")
 
                 stats_text = (
                     f"**Bot Statistics**\n\n"
                     f"👥 **Total Users:** {total_users}\n"
                     f"🎬 **Total Entries:** {total_entries}\n"
                     f"  - **Movies:** {movie_count}\n"
-                    f"  - **Series:** {series_count}"
+                    f"  - **Series:** {series_count}\n\n"
+                    f"🗂️ **Search Cache:** {search_cache.hits} hits / {search_cache.misses} misses "
+                    f"({search_cache.hit_ratio():.0%}), {len(search_cache.data)} entries\n"
+                    f"📥 **Update Queue:** {update_queue_depth()} pending"
                 )
                 return {'chat_id': user_id, 'text': stats_text, 'parse_mode': 'Markdown'}
 
             if command == '/add' and args:
-                if details := scrape_page_details(args[0]):
-                    await upsert_subtitle(details)
-                    return {'chat_id': user_id, 'text': f"✅ Added/Updated **{details['title']}**."}
-                return {'chat_id': user_id, 'text': "❌ Failed to scrape or add entry."}
+                position = await submit_admin_job(user_id, 'add', args[0])
+                return {'chat_id': user_id, 'text': f"⏳ Queued add for `{args[0]}` (position {position}). I'll message you when it's done.", 'parse_mode': 'Markdown'}
 
             if command == '/broadcast':
                 if not message.get('reply_to_message'):
                     return {'chat_id': user_id, 'text': "Please reply to a message to broadcast it."}
 
-                asyncio.create_task(run_broadcast(message))
+                start_broadcast_task(run_broadcast(message))
                 return {'chat_id': user_id, 'text': "Broadcast started... I will send a report when it's complete."}
 
     # Search
     if len(text) > 1:
-        query = """
-            SELECT *, similarity(title, $1) AS score
-            FROM subtitles
-            WHERE similarity(title, $1) > 0.15
-            ORDER BY score DESC
-            LIMIT 10
-        """
-        if results := await db_pool.fetch(query, text):
+        if results := await search_subtitles(text):
             return {'chat_id': user_id, 'text': f"🔍 Found these for '{text}':", 'reply_markup': create_search_results_keyboard(results)}
     return {'chat_id': user_id, 'text': f'😔 No subtitles found for "{text}"'}
 
-async def send_telegram_message(data: Any):
+# --- HTTP Client ---
+async def init_http_session():
+    global http_session
+    connector = aiohttp.TCPConnector(limit=HTTP_POOL_LIMIT, limit_per_host=HTTP_POOL_LIMIT_PER_HOST, keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=HTTP_TOTAL_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+    http_session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+    logger.info("HTTP client session initialized.")
+
+async def get_http_session() -> aiohttp.ClientSession:
+    # Lazily (re)create the shared session if startup has not run or it was closed.
+    if http_session is None or http_session.closed:
+        await init_http_session()
+    return http_session
+
+async def close_http_session():
+    global http_session
+    if http_session and not http_session.closed:
+        await http_session.close()
+    http_session = None
+
+# --- Outbound Rate Limiting ---
+# Methods that post into a chat and so count towards Telegram's per-chat message limit.
+CHAT_LIMITED_METHODS = {'sendMessage', 'sendPhoto', 'sendDocument', 'copyMessage', 'forwardMessage'}
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock() # Keeps waiters in FIFO order, so messages to one chat aren't reordered
+
+    def delay(self) -> float:
+        """Seconds until a token is available."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        async with self.lock:
+            while (wait := self.delay()) > 0:
+                await asyncio.sleep(wait)
+            self.tokens -= 1
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+class TelegramDispatcher:
+    """Hands out outbound Bot API slots from a global token bucket, serving interactive calls before bulk ones."""
+
+    def __init__(self):
+        self.bucket = TokenBucket(TELEGRAM_GLOBAL_RATE, TELEGRAM_GLOBAL_RATE)
+        self.chat_buckets = TTLCache(10000, 60) # Idle buckets are full again after a minute anyway
+        self.lanes = {PRIORITY_INTERACTIVE: deque(), PRIORITY_BULK: deque()}
+        self.lane_blocked_until = {PRIORITY_INTERACTIVE: 0.0, PRIORITY_BULK: 0.0}
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def chat_bucket(self, chat_id: Any) -> TokenBucket:
+        # Chat ids arrive as int from messages and as str from callbacks; both must share one bucket.
+        key = str(chat_id)
+        if (bucket := self.chat_buckets.get(key)) is None:
+            bucket = TokenBucket(TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST)
+        self.chat_buckets.set(key, bucket)
+        return bucket
+
+    async def acquire(self, priority: int, chat_id: Any = None):
+        if chat_id is not None:
+            await self.chat_bucket(chat_id).acquire()
+        if not self.task: return # Not started (e.g. outside the app lifecycle); don't block callers.
+        future = asyncio.get_running_loop().create_future()
+        self.lanes[priority].append(future)
+        self.wakeup.set()
+        await future
+
+    def back_off(self, seconds: float, chat_id: Any = None, priority: int = PRIORITY_INTERACTIVE):
+        """Honours a 429: a per-chat limit only pauses that chat, so other users' replies keep flowing.
+
+        A broadcast sends each chat a single message, so a 429 there is global flood control: it pauses the whole bulk lane.
+        """
+        if priority == PRIORITY_BULK:
+            self.lane_blocked_until[priority] = max(self.lane_blocked_until[priority], time.monotonic() + seconds)
+        if chat_id is not None:
+            self.chat_bucket(chat_id).block(seconds)
+        elif priority != PRIORITY_BULK:
+            self.bucket.block(seconds)
+
+    def _next_lane(self) -> Optional[deque]:
+        now = time.monotonic()
+        return next((self.lanes[p] for p in sorted(self.lanes) if self.lanes[p] and self.lane_blocked_until[p] <= now), None)
+
+    def pending(self) -> Dict[int, int]:
+        return {priority: len(lane) for priority, lane in self.lanes.items()}
+
+    async def run(self):
+        while True:
+            if not self._next_lane():
+                # Nothing to send, or only blocked lanes: sleep until a call arrives or the earliest block lifts.
+                now = time.monotonic()
+                waits = [self.lane_blocked_until[p] - now for p, lane in self.lanes.items() if lane]
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=max(0.0, min(waits)) if waits else None)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.bucket.acquire()
+            # Pick the lane only after the token is granted so late interactive calls jump ahead.
+            if not (lane := self._next_lane()): continue # A 429 blocked the lane while we waited
+            future = lane.popleft()
+            if not future.done(): future.set_result(None)
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+telegram_dispatcher = TelegramDispatcher()
+
+def _form_field(form: aiohttp.FormData, name: str) -> Any:
+    # FormData has no public accessor; its fields are (options, headers, value) tuples.
+    return next((value for options, _, value in form._fields if options.get('name') == name), None)
+
+async def send_telegram_message(data: Any, priority: int = PRIORITY_INTERACTIVE):
     if not TOKEN or not data: return {}
 
-    method = 'sendDocument' if isinstance(data, aiohttp.FormData) else data.pop('method', 'sendMessage')
-    url = f"https://api.telegram.org/bot{TOKEN}/{method}"
+    is_form = isinstance(data, aiohttp.FormData)
+    method = 'sendDocument' if is_form else data.pop('method', 'sendMessage')
+    url = f"{TELEGRAM_API_URL}/bot{TOKEN}/{method}"
+    chat_id = None
+    if method in CHAT_LIMITED_METHODS:
+        chat_id = _form_field(data, 'chat_id') if is_form else data.get('chat_id')
 
     try:
-        async with aiohttp.ClientSession() as session:
-            post_kwargs = {'json': data} if isinstance(data, dict) else {'data': data}
-            async with session.post(url, **post_kwargs) as resp:
-                if resp.status != 200:
-                    logger.error(f"Telegram API Error: {await resp.text()}")
-                return await resp.json()
+        for attempt in range(TELEGRAM_MAX_RETRIES + 1):
+            await telegram_dispatcher.acquire(priority, chat_id)
+            session = await get_http_session()
+            post_kwargs = {'json': data} if not is_form else {'data': data}
+            with TELEGRAM_LATENCY.time(method), track_in_flight('telegram_requests'):
+                async with session.post(url, **post_kwargs) as resp:
+                    if resp.status == 429:
+                        result = await resp.json()
+                        retry_after = result.get('parameters', {}).get('retry_after', 1)
+                        telegram_dispatcher.back_off(retry_after, chat_id, priority)
+                        # A multipart body is consumed by the first attempt, so uploads can't be retried.
+                        if not is_form and attempt < TELEGRAM_MAX_RETRIES:
+                            logger.warning(f"Telegram rate limit on {method}, retrying in {retry_after}s (attempt {attempt + 1}).")
+                            continue
+                    if resp.status != 200:
+                        logger.error(f"Telegram API Error: {await resp.text()}")
+                    return await resp.json()
     except Exception as e:
         logger.error(f"Error sending message: {e}")
         return {}
 
+# --- Update Workers ---
+def _update_chat_id(update: dict) -> Any:
+    if callback_query := update.get('callback_query'):
+        return callback_query.get('message', {}).get('chat', {}).get('id') or callback_query.get('from', {}).get('id')
+    if message := update.get('message'):
+        return message.get('chat', {}).get('id')
+    return None
+
+def is_duplicate_update(update: dict) -> bool:
+    if (update_id := update.get('update_id')) is None: return False
+    if update_id in recent_update_ids: return True
+    recent_update_ids[update_id] = None
+    if len(recent_update_ids) > UPDATE_DEDUPE_SIZE:
+        recent_update_ids.popitem(last=False)
+    return False
+
+def enqueue_update(update: dict) -> bool:
+    """Routes an update to its chat's worker queue. Returns False if that queue is full."""
+    queue = update_queues[hash(_update_chat_id(update)) % len(update_queues)]
+    try:
+        queue.put_nowait(update)
+        return True
+    except asyncio.QueueFull:
+        return False
+
+def update_queue_depth() -> int:
+    return sum(queue.qsize() for queue in update_queues)
+
+async def handle_and_reply(update: dict):
+    if response_data := await handle_telegram_message(update):
+        await send_telegram_message(response_data)
+
+async def update_worker(queue: asyncio.Queue):
+    while True:
+        update = await queue.get()
+        try:
+            with UPDATE_LATENCY.time('worker'), track_in_flight('updates'):
+                await update_profiler.run(update, lambda: handle_and_reply(update))
+        except Exception as e:
+            logger.exception(f"Failed to handle update {update.get('update_id')}: {e}")
+        finally:
+            queue.task_done()
+
+def start_update_workers():
+    for _ in range(max(1, UPDATE_WORKERS)):
+        queue = asyncio.Queue(maxsize=UPDATE_QUEUE_SIZE)
+        update_queues.append(queue)
+        update_workers.append(asyncio.create_task(update_worker(queue)))
+
+async def stop_update_workers():
+    try:
+        await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in update_queues)), timeout=5)
+    except asyncio.TimeoutError:
+        logger.warning(f"Shutting down with {update_queue_depth()} updates still queued.")
+    for task in update_workers: task.cancel()
+    await asyncio.gather(*update_workers, return_exceptions=True)
+
 # --- FastAPI App ---
 app = FastAPI(title="Subtitle Search Bot API", version="3.3", redoc_url=None, docs_url=None)
 @app.on_event("startup")
-async def startup_event(): await init_db()
+async def startup_event():
+    global user_flush_task
+    await init_http_session()
+    telegram_dispatcher.start()
+    await init_db()
+    await reload_search_index()
+    await load_known_users()
+    user_flush_task = asyncio.create_task(user_flush_loop())
+    start_admin_job_workers()
+    start_update_workers()
+    await resume_broadcasts()
 @app.on_event("shutdown")
 async def shutdown_event():
+    await stop_update_workers()
+    await stop_admin_job_workers()
+    await stop_broadcasts()
+    if user_flush_task: user_flush_task.cancel()
+    await flush_users()
+    if db_listen_conn: await db_listen_conn.close()
     if db_pool: await db_pool.close()
+    await telegram_dispatcher.stop()
+    await close_http_session()
 
 @app.post("/telegram")
 async def telegram_webhook(request: Request):
+    with UPDATE_LATENCY.time('webhook'):
+        return await _telegram_webhook(request)
+
+async def _telegram_webhook(request: Request):
     if WEBHOOK_SECRET != request.headers.get("X-Telegram-Bot-Api-Secret-Token"): return Response(status_code=403)
+    update = None
     try:
-        if response_data := await handle_telegram_message(await request.json()):
-            await send_telegram_message(response_data)
+        update = await request.json()
+        if is_duplicate_update(update):
+            logger.info(f"Dropping redelivered update {update.get('update_id')}")
+            return Response(status_code=200)
+
+        if not WEBHOOK_REPLY:
+            # Acknowledge at once so slow handlers never make Telegram time out and redeliver.
+            if not enqueue_update(update):
+                recent_update_ids.pop(update.get('update_id'), None)
+                logger.warning("Update queue full, asking Telegram to redeliver later.")
+                return Response(status_code=503)
+            return Response(status_code=200)
+
+        if response_data := await update_profiler.run(update, lambda: handle_telegram_message(update)):
+            # Telegram executes a method returned in the webhook response, saving an outbound request.
+            # The result of that call is not returned to us, which is fine for these final replies.
+            return JSONResponse({'method': response_data.pop('method', 'sendMessage'), **response_data})
         return Response(status_code=200)
     except Exception as e:
         logger.error(f"Webhook error: {e}")
+        # Let Telegram's redelivery of this update through the dedupe check.
+        if isinstance(update, dict): recent_update_ids.pop(update.get('update_id'), None)
         return Response(status_code=500)
+
+@app.get("/healthz")
+async def healthz():
+    db_ok = db_pool is not None and not db_pool.is_closing()
+    telegram_ok = http_session is not None and not http_session.closed
+    return JSONResponse({
+        'status': 'ok' if db_ok and telegram_ok else 'degraded',
+        'db': {'connected': db_ok, 'size': db_pool.get_size() if db_ok else 0, 'idle': db_pool.get_idle_size() if db_ok else 0},
+        'telegram_client': {'open': telegram_ok, 'dispatcher_running': telegram_dispatcher.task is not None},
+        'update_queue_depth': update_queue_depth(),
+    })
+
+def render_metrics() -> str:
+    lines = []
+    for histogram in (UPDATE_LATENCY, SQL_LATENCY, TELEGRAM_LATENCY, DOWNLOAD_LATENCY):
+        lines += histogram.render()
+
+    gauges = {
+        'bot_in_flight': ("Operations currently in progress.", [(f'kind="{k}"', v) for k, v in in_flight.items()]),
+        'bot_update_queue_depth': ("Updates waiting for a worker.", [("", update_queue_depth())]),
+        'bot_telegram_pending': ("Bot API calls waiting for a rate-limit slot.", [(f'lane="{"interactive" if p == PRIORITY_INTERACTIVE else "bulk"}"', n) for p, n in telegram_dispatcher.pending().items()]),
+        'bot_cache_hit_ratio': ("Hit ratio of in-process caches.", [(f'cache="{n}"', c.hit_ratio()) for n, c in (('search', search_cache), ('membership', membership_cache))]),
+        'bot_cache_entries': ("Entries held by in-process caches.", [(f'cache="{n}"', len(c.data)) for n, c in (('search', search_cache), ('membership', membership_cache))]),
+    }
+    if db_pool is not None:
+        gauges['bot_db_pool_connections'] = ("Database pool connections by state.", [
+            ('state="max"', db_pool.get_max_size()), ('state="open"', db_pool.get_size()),
+            ('state="in_use"', db_pool.get_size() - db_pool.get_idle_size()),
+        ])
+    for name, (help_text, samples) in gauges.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        lines += [f"{name}{{{labels}}} {value}" if labels else f"{name} {value}" for labels, value in samples]
+
+    lines += ["# HELP bot_cache_requests_total Cache lookups by result.", "# TYPE bot_cache_requests_total counter"]
+    for name, cache in (('search', search_cache), ('membership', membership_cache)):
+        lines += [f'bot_cache_requests_total{{cache="{name}",result="hit"}} {cache.hits}', f'bot_cache_requests_total{{cache="{name}",result="miss"}} {cache.misses}']
+    return "\n".join(lines) + "\n"
+
+@app.get("/metrics")
+async def metrics(request: Request):
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}": return Response(status_code=403)
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,148 @@
+"""Benchmarks the release-page parsers in scraper.py and app.py over saved HTML fixtures.
+
+For every parser it reports pages/sec and the peak memory allocated per page, and it
+checks that the fast path (lxml) returns exactly the same fields
+as the html.parser baseline on every fixture.
+
+The committed fixtures are small hand-built pages (marked with a bench-fixture meta tag)
+that cover the layouts the parsers must agree on. Their throughput and memory figures
+say little about production, where pages carry the theme's full header, scripts and
+widgets, so the report labels them; capture real pages with --fetch N for those numbers.
+
+Usage:
+    python benchmarks/bench_parsers.py                # parse benchmarks/fixtures/*.html
+    python benchmarks/bench_parsers.py --fetch 20     # first save 20 live release pages as fixtures
+    python benchmarks/bench_parsers.py --repeat 10
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from urllib.parse import urljoin, urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+SYNTHETIC_MARKER = '<meta name="bench-fixture" content="synthetic">'
+sys.path.insert(0, ROOT)
+
+import scraper  # noqa: E402
+
+
+def fetch_fixtures(count):
+    """Saves the first `count` release pages from the live listing into FIXTURES_DIR."""
+    import requests
+    from bs4 import BeautifulSoup
+
+    page_url, saved = scraper.RELEASES_URL, 0
+    while page_url and saved < count:
+        listing = BeautifulSoup(requests.get(page_url, headers=scraper.HEADERS, timeout=20).text, 'html.parser')
+        for link in listing.select('article.loop-entry h2.entry-title a'):
+            if saved >= count: break
+            url = urljoin(scraper.BASE_URL, link['href'])
+            slug = urlparse(url).path.strip('/').split('/')[-1] or f"release-{saved}"
+            with open(os.path.join(FIXTURES_DIR, f"{slug}.html"), 'w', encoding='utf-8') as f:
+                f.write(requests.get(url, headers=scraper.HEADERS, timeout=20).text)
+            saved += 1
+            print(f"saved {slug}.html")
+        next_link = listing.select_one('a.next.page-numbers')
+        page_url = urljoin(scraper.BASE_URL, next_link['href']) if next_link else None
+
+
+def load_fixtures():
+    fixtures = []
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        if name.endswith('.html'):
+            with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+                fixtures.append((name, f"{scraper.BASE_URL}/{name[:-5]}/", f.read()))
+    return fixtures
+
+
+def describe(fixtures):
+    """Says how many fixtures were captured from the site and how many are hand-built."""
+    synthetic = sum(SYNTHETIC_MARKER in html for _, _, html in fixtures)
+    if not synthetic:
+        return f"{len(fixtures)} captured pages"
+    if synthetic == len(fixtures):
+        return f"{len(fixtures)} SYNTHETIC hand-built pages; pages/s and KiB do not reflect production (capture real ones with --fetch N)"
+    return (f"{len(fixtures) - synthetic} captured and {synthetic} SYNTHETIC hand-built pages; "
+            f"pages/s and KiB are skewed by the synthetic ones")
+
+
+def build_parsers():
+    """Returns (name, baseline name, parse function) triples; the app parsers need the bot's dependencies."""
+    parsers = [
+        ("scraper html.parser", None, lambda html, url: scraper.parse_detail_page(html, url, fast=False)),
+        (f"scraper fast ({scraper.FAST_HTML_PARSER})", "scraper html.parser", lambda html, url: scraper.parse_detail_page(html, url, fast=True)),
+    ]
+    try:
+        import app
+    except ImportError as e:
+        print(f"Skipping app.py parsers ({e})")
+        return parsers
+    return parsers + [
+        ("app html.parser", None, lambda html, url: app.parse_page_details(html, url, fast=False)),
+        (f"app fast ({app._FAST_HTML_PARSER})", "app html.parser", lambda html, url: app.parse_page_details(html, url, fast=True)),
+    ]
+
+
+def measure(parse, fixtures, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for _, url, html in fixtures:
+            parse(html, url)
+    pages_per_sec = repeat * len(fixtures) / (time.perf_counter() - started)
+
+    # Memory is measured in a separate pass because tracemalloc slows parsing down considerably.
+    peaks = []
+    for _, url, html in fixtures:
+        tracemalloc.start()
+        parse(html, url)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return pages_per_sec, max(peaks), sum(peaks) / len(peaks)
+
+
+def compare(baseline, candidate):
+    """Returns the fields whose values differ between two parse results."""
+    if baseline is None or candidate is None:
+        return [] if baseline == candidate else ['<whole page>']
+    return sorted(key for key in baseline.keys() | candidate.keys() if baseline.get(key) != candidate.get(key))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fetch', type=int, default=0, help="save this many live release pages as fixtures first")
+    parser.add_argument('--repeat', type=int, default=5, help="timed passes over the fixtures per parser")
+    args = parser.parse_args()
+
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    if args.fetch:
+        fetch_fixtures(args.fetch)
+    fixtures = load_fixtures()
+    if not fixtures:
+        sys.exit(f"No fixtures in {FIXTURES_DIR}; run with --fetch N to save some release pages.")
+
+    parsers = build_parsers()
+    results = {name: [parse(html, url) for _, url, html in fixtures] for name, _, parse in parsers}
+
+    print(f"\n{describe(fixtures)}, {args.repeat} passes\n")
+    print(f"{'parser':<28} {'pages/s':>10} {'peak KiB':>10} {'mean KiB':>10}  identical")
+    failed = False
+    for name, baseline, parse in parsers:
+        pages_per_sec, peak, mean = measure(parse, fixtures, args.repeat)
+        mismatches = []
+        if baseline:
+            for (fixture, _, _), expected, actual in zip(fixtures, results[baseline], results[name]):
+                if fields := compare(expected, actual):
+                    mismatches.append(f"{fixture}: {', '.join(fields)}")
+        verdict = "-" if not baseline else ("yes" if not mismatches else f"NO ({len(mismatches)} pages)")
+        print(f"{name:<28} {pages_per_sec:>10.1f} {peak / 1024:>10.0f} {mean / 1024:>10.0f}  {verdict}")
+        for mismatch in mismatches:
+            print(f"    {mismatch}")
+        failed = failed or bool(mismatches)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Checks that CrawlState checkpoints never lose statuses recorded while a checkpoint is being written.
+
+Detail workers and discovery keep calling failed()/enqueue()/set_cursor() while checkpoint()
+awaits the database, so this drives checkpoint() against a fake connection that yields
+mid-write and asserts every status reaches a later checkpoint. No database is needed;
+exits non-zero on any failed check.
+
+Usage:
+    python benchmarks/check_crawl_state.py
+"""
+import asyncio
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import scraper  # noqa: E402
+
+failures = []
+
+
+def check(name, actual, expected):
+    if actual != expected:
+        failures.append(name)
+        print(f"FAIL {name}\n  expected {expected!r}\n  got      {actual!r}")
+    else:
+        print(f"ok   {name}")
+
+
+class FakeTransaction:
+    async def __aenter__(self): return self
+    async def __aexit__(self, *exc): return False
+
+
+class FakeConnection:
+    """Records what each checkpoint writes; yields to other tasks mid-write and can be told to fail."""
+
+    def __init__(self):
+        self.saved = {}  # url -> (status, attempts, error)
+        self.cursor = None
+        self.fail = False
+
+    def transaction(self):
+        return FakeTransaction()
+
+    async def executemany(self, query, rows):
+        await asyncio.sleep(0.01)
+        if self.fail: raise ConnectionError("connection lost")
+        for run, url, status, attempts, error in rows:
+            self.saved[url] = (status, attempts, error)
+
+    async def execute(self, query, *args):
+        await asyncio.sleep(0)
+        self.cursor = args[:2]
+
+
+async def check_interleaving():
+    conn, queue = FakeConnection(), asyncio.Queue()
+    state = scraper.CrawlState(conn)
+    await state.enqueue(queue, 'a')
+    state.set_cursor('page-2', 2)
+
+    checkpoint = asyncio.create_task(state.checkpoint())
+    await asyncio.sleep(0)  # the checkpoint is now awaiting the write
+    state.failed('b', 'fetch failed')
+    await state.enqueue(queue, 'c')
+    state.set_cursor('page-3', 3)
+    await checkpoint
+    check("first checkpoint saves what was recorded before it", conn.saved, {'a': ('pending', 0, None)})
+    check("first checkpoint saves the cursor it started with", conn.cursor, ('page-2', 2))
+
+    await state.checkpoint()
+    check("statuses recorded during a checkpoint reach the next one", conn.saved, {
+        'a': ('pending', 0, None), 'b': ('failed', 1, 'fetch failed'), 'c': ('pending', 0, None),
+    })
+    check("a cursor moved during a checkpoint reaches the next one", conn.cursor, ('page-3', 3))
+
+
+async def check_failed_write():
+    conn, queue = FakeConnection(), asyncio.Queue()
+    state = scraper.CrawlState(conn)
+    await state.enqueue(queue, 'a')
+    await state.enqueue(queue, 'b')
+    state.set_cursor('page-2', 2)
+
+    conn.fail = True
+    checkpoint = asyncio.create_task(state.checkpoint())
+    await asyncio.sleep(0)
+    state.done('b')  # newer than the 'pending' in the failing batch
+    await checkpoint
+    check("a failed checkpoint keeps its statuses, newer ones winning", state.dirty, {
+        'a': ('pending', None), 'b': ('done', None),
+    })
+    check("a failed checkpoint keeps the cursor dirty", state.cursor_dirty, True)
+
+    conn.fail = False
+    await state.checkpoint()
+    check("the retried checkpoint saves them", conn.saved, {'a': ('pending', 0, None), 'b': ('done', 0, None)})
+    check("the retried checkpoint saves the cursor", conn.cursor, ('page-2', 2))
+
+
+def main():
+    asyncio.run(check_interleaving())
+    asyncio.run(check_failed_write())
+    print(f"\n{len(failures)} failed" if failures else "\nall checks passed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""Checks feed and sitemap discovery in scraper.py against the saved fixtures in benchmarks/fixtures.
+
+It asserts the URLs and lastmod values parse_feed/parse_sitemap extract, which releases
+discover_from_feeds queues as new or modified and which it skips as known, and when it
+returns False so the scraper falls back to walking the listing. No network or database
+is needed; exits non-zero on any failed check.
+
+Usage:
+    python benchmarks/check_discovery.py
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+sys.path.insert(0, ROOT)
+
+import scraper  # noqa: E402
+
+SITE = scraper.BASE_URL
+SITEMAP_INDEX_URL = f"{SITE}/sitemap_index.xml"
+RELEASES = {slug: f"{SITE}/releases/{slug}/" for slug in (
+    'the-holdovers-2023', 'anatomy-of-a-fall-2023', 'perfect-days-2023',
+    'dark-season-1-2017', 'nayakan-1987', 'manichitrathazhu-1993',
+)}
+failures = []
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def check(name, actual, expected):
+    if actual != expected:
+        failures.append(name)
+        print(f"FAIL {name}\n  expected {expected!r}\n  got      {actual!r}")
+    else:
+        print(f"ok   {name}")
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+
+class FakeFetcher:
+    """Serves fixture text by URL; URLs it does not know fetch as failed, like a 404 after retries."""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requested = []
+
+    async def fetch(self, url):
+        self.requested.append(url)
+        if (text := self.pages.get(url)) is None: return None
+        return scraper.FetchResult(url, 200, text, {})
+
+
+async def discover(pages, known_urls):
+    """Runs discover_from_feeds; returns (result, queued URLs, known count, requested URLs)."""
+    fetcher, detail_queue = FakeFetcher(pages), asyncio.Queue()
+    stats = {'known': 0}
+    result = await scraper.discover_from_feeds(fetcher, detail_queue, dict(known_urls), scraper.CrawlState(None), stats)
+    queued = set()
+    while not detail_queue.empty():
+        queued.add(detail_queue.get_nowait())
+    return result, queued, stats['known'], fetcher.requested
+
+
+def check_parsers():
+    check("parse_feed keeps site posts in order, canonicalised",
+          scraper.parse_feed(fixture('feed.xml')),
+          [RELEASES['the-holdovers-2023'], RELEASES['anatomy-of-a-fall-2023'], RELEASES['perfect-days-2023']])
+
+    entries, children = scraper.parse_sitemap(fixture('sitemap-index.xml'))
+    check("parse_sitemap index has no URL entries", entries, [])
+    check("parse_sitemap index children and lastmods", children, [
+        (f"{SITE}/post-sitemap.xml", utc(2024, 5, 11, 6, 30, 12)),
+        (f"{SITE}/post-sitemap2.xml", utc(2023, 11, 2, 13, 44, 37)),
+        (f"{SITE}/page-sitemap.xml", utc(2024, 1, 15, 10, 20)),
+        (f"{SITE}/category-sitemap.xml", utc(2024, 5, 11, 6, 30, 12)),
+    ])
+    check("only post sitemaps are followed",
+          [url for url, _ in children if scraper.SITEMAP_CHILD_RE.search(url)],
+          [f"{SITE}/post-sitemap.xml", f"{SITE}/post-sitemap2.xml"])
+
+    entries, children = scraper.parse_sitemap(fixture('post-sitemap.xml'))
+    check("parse_sitemap post sitemap has no children", children, [])
+    check("parse_sitemap post URLs and lastmods in UTC", entries, [
+        (RELEASES['the-holdovers-2023'], utc(2024, 5, 11, 6, 30, 12)),
+        (RELEASES['dark-season-1-2017'], utc(2024, 5, 10, 2, 45)),
+        (RELEASES['anatomy-of-a-fall-2023'], utc(2024, 5, 9, 14, 2, 45)),
+        (RELEASES['perfect-days-2023'], utc(2024, 4, 22, 17, 45)),
+        (RELEASES['nayakan-1987'], utc(2019, 3, 4)),
+        (RELEASES['manichitrathazhu-1993'], None),
+    ])
+
+
+async def check_discovery():
+    feed, index, posts = fixture('feed.xml'), fixture('sitemap-index.xml'), fixture('post-sitemap.xml')
+    both = {scraper.FEED_URL: feed, SITEMAP_INDEX_URL: index, f"{SITE}/post-sitemap.xml": posts}
+    scraped = {
+        RELEASES['perfect-days-2023']: utc(2024, 5, 1),  # lastmod 2024-04-22: unchanged since
+        RELEASES['dark-season-1-2017']: utc(2024, 5, 1),  # lastmod 2024-05-10: new episodes added
+        RELEASES['nayakan-1987']: utc(2020, 1, 1),
+        RELEASES['manichitrathazhu-1993']: None,  # no lastmod and no scrape time: left alone
+    }
+
+    result, queued, known, requested = await discover(both, scraped)
+    check("incremental run reads the feed and sitemaps", result, True)
+    check("incremental run queues new and modified releases", queued,
+          {RELEASES['the-holdovers-2023'], RELEASES['anatomy-of-a-fall-2023'], RELEASES['dark-season-1-2017']})
+    check("incremental run counts unchanged releases as known", known, 3)
+    check("children older than the last scrape are not fetched", requested,
+          [scraper.FEED_URL, SITEMAP_INDEX_URL, f"{SITE}/post-sitemap.xml"])
+
+    result, queued, known, requested = await discover(both, {})
+    check("first run reads the feed and sitemaps", result, True)
+    check("first run queues every release", queued, set(RELEASES.values()))
+    check("first run follows every post sitemap", f"{SITE}/post-sitemap2.xml" in requested, True)
+
+    feed_only = {scraper.FEED_URL: feed}
+    result, queued, _, _ = await discover(feed_only, {})
+    check("feed alone with every item new falls back to the listing", result, False)
+    check("feed items are still queued before the fallback", len(queued), 3)
+
+    result, queued, _, _ = await discover(feed_only, scraped)
+    check("feed alone reaching a known post does not fall back", result, True)
+    check("feed alone queues only the new posts", queued, {RELEASES['the-holdovers-2023'], RELEASES['anatomy-of-a-fall-2023']})
+
+    result, queued, _, _ = await discover({scraper.FEED_URL: feed, SITEMAP_INDEX_URL: '<urlset'}, {})
+    check("a malformed sitemap counts as unavailable", (result, len(queued)), (False, 3))
+
+    index_only = {scraper.FEED_URL: feed, SITEMAP_INDEX_URL: index}
+    result, queued, _, requested = await discover(index_only, {})
+    check("an index whose post sitemaps all fail falls back to the listing", (result, len(queued)), (False, 3))
+    check("every changed post sitemap was tried first", requested,
+          [scraper.FEED_URL, SITEMAP_INDEX_URL, f"{SITE}/post-sitemap.xml", f"{SITE}/post-sitemap2.xml"])
+
+    partial = {**index_only, f"{SITE}/post-sitemap.xml": posts}
+    result, queued, _, _ = await discover(partial, {})
+    check("one readable post sitemap is enough", (result, queued), (True, set(RELEASES.values())))
+
+    unchanged = {scraper.FEED_URL: feed, SITEMAP_INDEX_URL: index.replace('2024-05-11T06:30:12', '2024-04-01T00:00:00')}
+    result, queued, _, requested = await discover(unchanged, scraped)
+    check("an index with no changed post sitemaps is still read", (result, len(requested)), (True, 2))
+
+    unmatched = {scraper.FEED_URL: feed, SITEMAP_INDEX_URL: index.replace('post-sitemap', 'release-map')}
+    result, _, _, _ = await discover(unmatched, {})
+    check("an index with no post sitemaps at all counts as unavailable", result, False)
+
+    result, queued, _, _ = await discover({}, scraped)
+    check("neither source available falls back to the listing", (result, queued), (False, set()))
+
+
+def main():
+    scraper.SITEMAP_URL = SITEMAP_INDEX_URL
+    check_parsers()
+    asyncio.run(check_discovery())
+    print(f"\n{len(failures)} failed" if failures else "\nall checks passed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+"""End-to-end load test of the /telegram webhook against local stand-ins.
+
+Starts a fake Telegram Bot API (records every call and can add latency and 429s), a fake
+subtitle origin serving .srt and .zip files, seeds synthetic subtitles into a local Postgres
+and runs the bot under uvicorn pointed at all three. It then posts /start, search, view and
+download updates at the requested rate and concurrency and reports:
+
+  * webhook latency   - time until /telegram answered
+  * end-to-end latency - time until the last Bot API call made for that update
+  * updates/sec, and outbound Bot API calls per update by method
+
+Every update is sent from its own synthetic user so outbound calls can be attributed to it.
+Use a throwaway database: rows with unique_id 'loadtest-*' are replaced on every run.
+
+Usage:
+    python benchmarks/loadtest.py --database-url postgresql://localhost/subs_loadtest
+    python benchmarks/loadtest.py --database-url ... --updates 2000 --rate 100 --concurrency 50
+    python benchmarks/loadtest.py --database-url ... --api-latency 0.05 --api-429-rate 0.02
+    python benchmarks/loadtest.py --database-url ... --mix search=1 --env WEBHOOK_REPLY=true
+    python benchmarks/loadtest.py --database-url ... --replay recorded_updates.jsonl
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+import zipfile
+from collections import Counter, defaultdict
+
+import aiohttp
+import asyncpg
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import SUBTITLES_CHANNEL, _normalize_title  # noqa: E402
+
+TOKEN = "loadtest"
+WEBHOOK_SECRET = "loadtest"
+USER_ID_BASE = 7_000_000_000 # Synthetic users; well above real Telegram ids
+TITLE_WORDS = ["Drishyam", "Premam", "Kumbalangi", "Nights", "Bangalore", "Days", "Minnal", "Murali", "Lucifer",
+               "Charlie", "Virus", "Joji", "Trance", "Angamaly", "Diaries", "Maheshinte", "Prathikaaram", "Ayyappanum",
+               "Koshiyum", "Kireedam", "Manichitrathazhu", "Spadikam", "Thondimuthalum", "Driksakshiyum", "Ustad", "Hotel"]
+
+
+# --- Fake Telegram Bot API ---
+class FakeBotAPI:
+    """Answers Bot API calls with plausible results and records (method, chat_id, time) for each."""
+
+    def __init__(self, latency: float, rate_limit_fraction: float, retry_after: int):
+        self.latency = latency
+        self.rate_limit_fraction = rate_limit_fraction
+        self.retry_after = retry_after
+        self.calls = []
+        self.rate_limited = Counter()
+        self.message_id = 0
+        self.file_id = 0
+
+    async def handle(self, request: web.Request):
+        method = request.match_info['method']
+        if request.content_type.startswith('multipart/'):
+            params = {k: v for k, v in (await request.post()).items() if isinstance(v, str)}
+        else:
+            params = await request.json() if request.can_read_body else {}
+        if self.latency: await asyncio.sleep(random.uniform(0.5, 1.5) * self.latency)
+        if random.random() < self.rate_limit_fraction:
+            self.rate_limited[method] += 1
+            return web.json_response({'ok': False, 'error_code': 429, 'description': f"Too Many Requests: retry after {self.retry_after}",
+                                      'parameters': {'retry_after': self.retry_after}}, status=429)
+        self.calls.append((method, self.user_of(method, params), time.perf_counter()))
+        return web.json_response({'ok': True, 'result': self.result_for(method, params)})
+
+    @staticmethod
+    def user_of(method: str, params: dict) -> str:
+        """The synthetic user a call was made for; these methods don't carry the user's chat_id."""
+        if method == 'getChatMember': return str(params.get('user_id', ''))
+        if method == 'answerCallbackQuery': return str(params.get('callback_query_id', '')).removeprefix('cb-')
+        return str(params.get('chat_id', ''))
+
+    def result_for(self, method: str, params: dict):
+        if method == 'getChatMember':
+            return {'status': 'member', 'user': {'id': params.get('user_id')}}
+        if method not in ('sendMessage', 'sendPhoto', 'sendDocument', 'editMessageText', 'copyMessage'):
+            return True
+        self.message_id += 1
+        message = {'message_id': self.message_id, 'date': int(time.time()), 'chat': {'id': params.get('chat_id')}}
+        if method == 'sendPhoto':
+            self.file_id += 1
+            message['photo'] = [{'file_id': f"photo-{self.file_id}-small"}, {'file_id': f"photo-{self.file_id}"}]
+        elif method == 'sendDocument':
+            self.file_id += 1
+            message['document'] = {'file_id': f"document-{self.file_id}"}
+        return message
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        return app
+
+
+# --- Fake Subtitle Origin ---
+def _make_origin_app(latency: float) -> web.Application:
+    """Serves /files/<n>.srt and /files/<n>.zip (two .srt members), plus /posters/<n>.jpg."""
+    srt = "1\n00:00:01,000 --> 00:00:04,000\nലോഡ് ടെസ്റ്റ്\n\n".encode() * 200
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.writestr("part1.srt", srt)
+        zf.writestr("part2.srt", srt)
+    archive = archive.getvalue()
+
+    async def files(request: web.Request):
+        if latency: await asyncio.sleep(latency)
+        name = request.match_info['name']
+        return web.Response(body=archive if name.endswith('.zip') else srt, content_type='application/octet-stream')
+
+    async def posters(request: web.Request):
+        return web.Response(body=b'\xff\xd8\xff\xe0' + b'\0' * 2048, content_type='image/jpeg')
+
+    app = web.Application()
+    app.router.add_get('/files/{name}', files)
+    app.router.add_get('/posters/{name}', posters)
+    return app
+
+async def start_site(app: web.Application, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    return runner
+
+
+# --- Database Seeding ---
+def _synthetic_titles(count: int, rng: random.Random):
+    titles = set()
+    while len(titles) < count:
+        titles.add(" ".join(rng.sample(TITLE_WORDS, rng.randint(1, 3))))
+    return [(title, rng.randint(1980, 2024)) for title in sorted(titles)]
+
+async def seed_database(database_url: str, rows: int, origin_url: str, rng: random.Random):
+    """Replaces the loadtest-* subtitles and returns their (unique_id, title, year)."""
+    entries = [(f"loadtest-{i}", title, year) for i, (title, year) in enumerate(_synthetic_titles(rows, rng))]
+    conn = await asyncpg.connect(database_url)
+    try:
+        async with conn.transaction():
+            await conn.execute("DELETE FROM subtitle_files WHERE unique_id LIKE 'loadtest-%'")
+            await conn.execute("DELETE FROM subtitles WHERE unique_id LIKE 'loadtest-%'")
+            await conn.executemany("""
+                INSERT INTO subtitles (unique_id, source_url, scraped_at, title, year, is_series, srt_url, poster_url,
+                                       description, director, genre, language, translator, search_title)
+                VALUES ($1, $2, now(), $3, $4, false, $5, $6, $7, $8, $9, $10, $11, $12)
+            """, [(uid, f"{origin_url}/{uid}/", title, year, f"{origin_url}/files/{i}.{'zip' if i % 2 else 'srt'}",
+                   f"{origin_url}/posters/{i}.jpg", f"Synthetic load test entry for {title}.",
+                   json.dumps({'name': "Load Tester", 'url': None}), json.dumps({'name': "Drama", 'url': None}),
+                   json.dumps({'name': "Malayalam", 'url': None}), json.dumps({'name': "Load Tester", 'url': None}),
+                   _normalize_title(title)) for i, (uid, title, year) in enumerate(entries)])
+            # The bot clears its search cache and reloads its in-memory index on this notification.
+            await conn.execute("SELECT pg_notify($1, 'loadtest')", SUBTITLES_CHANNEL)
+    finally:
+        await conn.close()
+    return entries
+
+
+# --- Update Generation ---
+def _message_update(user_id: int, text: str) -> dict:
+    user = {'id': user_id, 'is_bot': False, 'first_name': f"Load {user_id}"}
+    return {'message': {'message_id': 1, 'date': int(time.time()), 'from': user, 'chat': {'id': user_id, 'type': 'private'}, 'text': text}}
+
+def _callback_update(user_id: int, data: str) -> dict:
+    user = {'id': user_id, 'is_bot': False, 'first_name': f"Load {user_id}"}
+    message = {'message_id': 1, 'date': int(time.time()), 'chat': {'id': user_id, 'type': 'private'}}
+    return {'callback_query': {'id': f"cb-{user_id}", 'from': user, 'message': message, 'data': data}}
+
+def synthetic_updates(count: int, mix: dict, entries: list, rng: random.Random):
+    kinds, weights = zip(*mix.items())
+    for _ in range(count):
+        kind = rng.choices(kinds, weights)[0]
+        uid, title, year = rng.choice(entries)
+        if kind == 'start':
+            yield kind, lambda user_id: _message_update(user_id, '/start')
+        elif kind == 'search':
+            query = f"{title} {year}" if rng.random() < 0.3 else title.lower()
+            yield kind, lambda user_id, query=query: _message_update(user_id, query)
+        elif kind == 'view':
+            yield kind, lambda user_id, uid=uid: _callback_update(user_id, f"view_{uid}")
+        elif kind == 'download':
+            yield kind, lambda user_id, uid=uid: _callback_update(user_id, f"download_{uid}")
+        else:
+            raise SystemExit(f"Unknown update kind in --mix: {kind}")
+
+def replayed_updates(path: str, count: int):
+    """Recorded updates, cycled up to `count`; ids are rewritten per send so no update is deduped or merged."""
+    with open(path, encoding='utf-8') as f:
+        recorded = [json.loads(line) for line in f if line.strip()]
+    if not recorded: raise SystemExit(f"No updates in {path}")
+
+    def rewrite(update, user_id):
+        update = json.loads(json.dumps(update))
+        update.pop('update_id', None)
+        for body in (update.get('message'), update.get('callback_query')):
+            if not body: continue
+            if 'from' in body: body['from']['id'] = user_id
+            if 'chat' in body: body['chat']['id'] = user_id
+            if 'message' in body and 'chat' in body['message']: body['message']['chat']['id'] = user_id
+        return update
+
+    for i in range(count or len(recorded)):
+        update = recorded[i % len(recorded)]
+        kind = 'callback' if 'callback_query' in update else 'message'
+        yield kind, lambda user_id, update=update: rewrite(update, user_id)
+
+
+# --- Load Generation ---
+async def send_updates(bot_url: str, updates, rate: float, concurrency: int):
+    """Posts the updates and returns one record per update: kind, user id, sent and answered times, status."""
+    semaphore = asyncio.Semaphore(concurrency)
+    records, tasks = [], []
+    headers = {'X-Telegram-Bot-Api-Secret-Token': WEBHOOK_SECRET}
+
+    async def post(session, record, update):
+        async with semaphore:
+            record['sent'] = time.perf_counter()
+            try:
+                async with session.post(f"{bot_url}/telegram", json=update, headers=headers) as resp:
+                    record['status'] = resp.status
+                    # With WEBHOOK_REPLY the final Bot API call comes back in the response body.
+                    record['inline'] = resp.content_type == 'application/json' and 'method' in await resp.json()
+            except aiohttp.ClientError as e:
+                record['status'] = type(e).__name__
+            record['answered'] = time.perf_counter()
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+        for i, (kind, build) in enumerate(updates):
+            if rate and (delay := started + i / rate - time.perf_counter()) > 0:
+                await asyncio.sleep(delay)
+            user_id = USER_ID_BASE + i
+            update = {'update_id': i + 1, **build(user_id)}
+            record = {'kind': kind, 'user_id': str(user_id), 'inline': False}
+            records.append(record)
+            tasks.append(asyncio.create_task(post(session, record, update)))
+        await asyncio.gather(*tasks)
+    return records, time.perf_counter() - started
+
+async def wait_for_quiet(api: FakeBotAPI, quiet: float, timeout: float):
+    """Waits until the bot has made no Bot API call for `quiet` seconds."""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        last = api.calls[-1][2] if api.calls else 0
+        if time.perf_counter() - last >= quiet: return True
+        await asyncio.sleep(0.1)
+    return False
+
+
+# --- Reporting ---
+def percentile(values, p):
+    if not values: return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def report(records, elapsed, api: FakeBotAPI, drained: bool):
+    last_call = {}
+    calls_by_user = Counter()
+    for method, chat_id, at in api.calls:
+        last_call[chat_id] = max(at, last_call.get(chat_id, 0))
+        calls_by_user[chat_id] += 1
+    answered = [r for r in records if 'answered' in r]
+    done = [r for r in answered if r['status'] == 200]
+    finished = max([r['answered'] for r in done] + [at for _, _, at in api.calls] + [0])
+
+    print(f"\n{len(records)} updates in {elapsed:.1f}s -> {len(records) / elapsed:.1f} sent/s, "
+          f"{len(done) / max(finished - records[0]['sent'], 1e-9):.1f} completed/s" if records else "No updates sent")
+    print(f"Webhook status: {dict(Counter(r['status'] for r in answered))}")
+    if not drained: print("WARNING: the bot was still making Bot API calls when the drain timeout expired.")
+
+    print(f"\n{'latency (ms)':<24} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'n':>6}")
+    by_kind = defaultdict(list)
+    for r in done: by_kind[r['kind']].append(r)
+    for label, group in [('all', done)] + sorted(by_kind.items()):
+        webhook = [(r['answered'] - r['sent']) * 1000 for r in group]
+        end_to_end = [(max(last_call.get(r['user_id'], 0), r['answered'] if r['inline'] else 0) - r['sent']) * 1000
+                      for r in group if r['user_id'] in last_call or r['inline']]
+        for name, values in ((f"{label} webhook", webhook), (f"{label} end-to-end", end_to_end)):
+            if values:
+                print(f"{name:<24} {percentile(values, 50):>8.1f} {percentile(values, 95):>8.1f} "
+                      f"{percentile(values, 99):>8.1f} {max(values):>8.1f} {len(values):>6}")
+
+    inline = sum(r['inline'] for r in done)
+    methods = Counter(method for method, _, _ in api.calls)
+    print(f"\nOutbound Bot API calls: {len(api.calls)} ({len(api.calls) / max(len(done), 1):.2f} per update)"
+          f"{f', plus {inline} answered inline' if inline else ''}")
+    for method, count in methods.most_common():
+        print(f"  {method:<22} {count:>7} ({count / max(len(done), 1):.2f}/update)")
+    for kind, group in sorted(by_kind.items()):
+        print(f"  per {kind:<18} {sum(calls_by_user[r['user_id']] for r in group) / len(group):>7.2f} calls/update")
+    if api.rate_limited:
+        print(f"Injected 429s: {dict(api.rate_limited)}")
+
+
+# --- Bot Process ---
+def start_bot(args, api_url: str) -> subprocess.Popen:
+    env = {k: v for k, v in os.environ.items() if k not in ('OWNER_ID', 'LOG_GROUP_ID', 'FORCE_SUB_CHANNEL_ID')}
+    env.update({'TELEGRAM_BOT_TOKEN': TOKEN, 'TELEGRAM_API_URL': api_url, 'WEBHOOK_SECRET': WEBHOOK_SECRET,
+                'DATABASE_URL': args.database_url})
+    if args.force_sub: env['FORCE_SUB_CHANNEL_ID'] = '-1001234567890'
+    env.update(dict(item.split('=', 1) for item in args.env))
+    log = open(args.bot_log, 'w') if args.bot_log else subprocess.DEVNULL
+    return subprocess.Popen([sys.executable, '-m', 'uvicorn', 'app:app', '--host', '127.0.0.1', '--port', str(args.bot_port),
+                             '--log-level', 'warning', '--no-access-log'], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+async def wait_for_bot(bot_url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.perf_counter() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.perf_counter() < deadline:
+            if process.poll() is not None: raise SystemExit(f"The bot exited with code {process.returncode}; see --bot-log.")
+            try:
+                async with session.get(f"{bot_url}/healthz") as resp:
+                    health = await resp.json()
+            except aiohttp.ClientError:
+                await asyncio.sleep(0.25)
+                continue
+            # Startup has finished once /healthz answers, so a missing pool will not recover.
+            if not health['db']['connected']: raise SystemExit("The bot could not connect to the database; check --database-url.")
+            return
+    raise SystemExit("The bot did not become healthy in time.")
+
+def stop_bot(process: subprocess.Popen):
+    if process.poll() is None:
+        process.send_signal(signal.SIGINT) # Lets the shutdown hook drain queues and flush users
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    api = FakeBotAPI(args.api_latency, args.api_429_rate, args.api_retry_after)
+    runners = [await start_site(api.app(), args.api_port), await start_site(_make_origin_app(args.origin_latency), args.origin_port)]
+    api_url, origin_url, bot_url = (f"http://127.0.0.1:{port}" for port in (args.api_port, args.origin_port, args.bot_port))
+
+    process = start_bot(args, api_url)
+    try:
+        await wait_for_bot(bot_url, process)
+        entries = await seed_database(args.database_url, args.seed_rows, origin_url, rng)
+        await asyncio.sleep(1) # Let the bot pick up the change notification
+        mix = {kind: float(weight) for kind, weight in (item.split('=') for item in args.mix.split(','))}
+        updates = replayed_updates(args.replay, args.updates) if args.replay else synthetic_updates(args.updates, mix, entries, rng)
+
+        records, elapsed = await send_updates(bot_url, updates, args.rate, args.concurrency)
+        drained = await wait_for_quiet(api, args.quiet, args.drain_timeout)
+        report(records, elapsed, api, drained)
+    finally:
+        stop_bot(process)
+        for runner in runners: await runner.cleanup()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', default=os.environ.get('LOADTEST_DATABASE_URL'), help="local Postgres (default $LOADTEST_DATABASE_URL)")
+    parser.add_argument('--updates', type=int, default=500, help="updates to send (with --replay, 0 sends each recorded update once)")
+    parser.add_argument('--rate', type=float, default=50, help="updates per second; 0 sends as fast as --concurrency allows")
+    parser.add_argument('--concurrency', type=int, default=20, help="webhook requests in flight at once")
+    parser.add_argument('--mix', default="search=6,view=2,download=1,start=1", help="weights of synthetic update kinds")
+    parser.add_argument('--replay', help="JSONL file of recorded updates to send instead of synthetic ones")
+    parser.add_argument('--seed-rows', type=int, default=200, help="synthetic subtitles to seed")
+    parser.add_argument('--api-latency', type=float, default=0.03, help="mean fake Bot API latency in seconds")
+    parser.add_argument('--api-429-rate', type=float, default=0.0, help="fraction of Bot API calls answered with 429")
+    parser.add_argument('--api-retry-after', type=int, default=1, help="retry_after sent with injected 429s")
+    parser.add_argument('--origin-latency', type=float, default=0.05, help="fake origin latency per download in seconds")
+    parser.add_argument('--force-sub', action='store_true', help="enable the force-subscribe check (getChatMember calls)")
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE', help="extra environment for the bot, repeatable")
+    parser.add_argument('--bot-port', type=int, default=18080)
+    parser.add_argument('--api-port', type=int, default=18081)
+    parser.add_argument('--origin-port', type=int, default=18082)
+    parser.add_argument('--bot-log', help="write the bot's log to this file")
+    parser.add_argument('--quiet', type=float, default=2, help="seconds without Bot API calls that count as drained")
+    parser.add_argument('--drain-timeout', type=float, default=60)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("--database-url (or LOADTEST_DATABASE_URL) is required")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,23 @@
-import requests
 from bs4 import BeautifulSoup
 import json
 import time
 import re
+import hashlib
+import unicodedata
 import logging
 import os
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse
 import asyncio
+import aiohttp
 import asyncpg
-from datetime import datetime, timedelta
+import argparse
+import multiprocessing
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import NamedTuple, Optional
+from datetime import datetime, timedelta, timezone
 
 # --- Setup ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -19,35 +28,67 @@ BASE_URL = "https://malayalamsubtitles.org"
 RELEASES_URL = f"{BASE_URL}/releases/"
 MAX_PAGES = int(os.environ.get("SCRAPER_MAX_PAGES", "5"))
 HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'}
+CONCURRENCY = int(os.environ.get("SCRAPER_CONCURRENCY", "8"))
+HOST_DELAY = float(os.environ.get("SCRAPER_HOST_DELAY", "0.1")) # Minimum gap between request starts per host
+MAX_HOST_DELAY = float(os.environ.get("SCRAPER_MAX_HOST_DELAY", "30"))
+MAX_RETRIES = int(os.environ.get("SCRAPER_MAX_RETRIES", "4"))
+REQUEST_TIMEOUT = float(os.environ.get("SCRAPER_REQUEST_TIMEOUT", "20"))
+QUEUE_SIZE = 100
+PARSE_WORKERS = int(os.environ.get("SCRAPER_PARSE_WORKERS", "0")) # Processes for HTML parsing; 0 parses on the event loop
+SUBTITLES_CHANNEL = "subtitles_changed" # The bot LISTENs on this to invalidate its search cache
+BATCH_SIZE = int(os.environ.get("SCRAPER_BATCH_SIZE", "200"))
+FLUSH_INTERVAL = float(os.environ.get("SCRAPER_FLUSH_INTERVAL", "5"))
+FAST_HTML_PARSE = os.environ.get("FAST_HTML_PARSE", "false").lower() in ("1", "true", "yes")
+DISCOVERY = os.environ.get("SCRAPER_DISCOVERY", "feed").lower() # 'feed' reads the RSS feed and sitemaps, 'listing' walks RELEASES_URL
+FEED_URL = os.environ.get("SCRAPER_FEED_URL", f"{BASE_URL}/feed/")
+SITEMAP_URL = os.environ.get("SCRAPER_SITEMAP_URL", f"{BASE_URL}/wp-sitemap.xml") # A sitemap index or a single post sitemap
+# Child sitemaps of the index that list releases (WordPress core and Yoast naming for posts and a 'release' post type).
+SITEMAP_CHILD_RE = re.compile(os.environ.get("SCRAPER_SITEMAP_CHILD_PATTERN", r'posts-(?:post|release)-\d+\.xml|/(?:post|release)-sitemap\d*\.xml'))
+CHECKPOINT_INTERVAL = float(os.environ.get("SCRAPER_CHECKPOINT_INTERVAL", "30")) # Seconds between crawl_state checkpoints
+MAX_ATTEMPTS = int(os.environ.get("SCRAPER_MAX_ATTEMPTS", "3")) # Runs in which a failing detail page is tried before it is given up
+STOP_AFTER_KNOWN = int(os.environ.get("SCRAPER_STOP_AFTER_KNOWN", "20")) # Consecutive already-scraped listing entries that end discovery; 0 walks all MAX_PAGES
+
+try:
+    import lxml  # noqa: F401
+    FAST_HTML_PARSER = 'lxml'
+except ImportError:
+    FAST_HTML_PARSER = 'html.parser'
+
+WHITESPACE_RE = re.compile(r'\s+')
+IMDB_ID_RE = re.compile(r'tt\d+')
+YEAR_RE = re.compile(r'\((\d{4})\)')
+SEASON_RES = [re.compile(p, re.IGNORECASE) for p in (r'Season\s*(\d+)', r'സീസൺ\s*(\d+)', r'S0?(\d+)', r'സീസണ്‍\s*(\d+)')]
+SERIES_NAME_SPLIT_RE = re.compile(r'\s+Season\s+\d|\s+സീസൺ\s+\d', re.IGNORECASE)
 
 # --- Helper Functions (Standalone) ---
-def get_soup(url):
-    try:
-        response = requests.get(url, headers=HEADERS, timeout=20)
-        response.raise_for_status()
-        return BeautifulSoup(response.text, 'html.parser')
-    except requests.RequestException as e:
-        logger.error(f"Error fetching {url}: {e}")
-        return None
-
 def clean_text(text):
-    return re.sub(r'\s+', ' ', text.strip()) if text else ""
+    return WHITESPACE_RE.sub(' ', text.strip()) if text else ""
 
 def extract_imdb_id(url):
-    match = re.search(r'tt\d+', url) if url else None
+    match = IMDB_ID_RE.search(url) if url else None
     return match.group(0) if match else None
 
+def canonical_url(url):
+    """Absolute release URL without query or fragment and with a trailing slash, so listing links match source_url."""
+    parts = urlparse(urljoin(BASE_URL, url))
+    path = parts.path if parts.path.endswith('/') else f"{parts.path}/"
+    return f"{parts.scheme}://{parts.netloc}{path}"
+
 def extract_year(title):
-    match = re.search(r'\((\d{4})\)', title)
+    match = YEAR_RE.search(title)
     return match.group(1) if match else None
 
+def normalize_title(title):
+    """Lower-cases a title, drops its "(YYYY)" year and punctuation, and collapses whitespace for search_title."""
+    title = YEAR_RE.sub(' ', title or "").lower()
+    return " ".join("".join(c if c.isalnum() or unicodedata.category(c).startswith('M') else ' ' for c in title).split())
+
 def extract_season_info(title):
-    patterns = [r'Season\s*(\d+)', r'സീസൺ\s*(\d+)', r'S0?(\d+)', r'സീസണ്‍\s*(\d+)']
     season_number = None
     is_series = False
 
-    for pattern in patterns:
-        match = re.search(pattern, title, re.IGNORECASE)
+    for pattern in SEASON_RES:
+        match = pattern.search(title)
         if match:
             season_number = int(match.group(1))
             is_series = True
@@ -60,14 +101,20 @@ def extract_season_info(title):
     if not is_series:
         return {'is_series': False, 'season_number': None, 'series_name': None}
 
-    series_name = re.split(r'\s+Season\s+\d|\s+സീസൺ\s+\d', title, 1, re.IGNORECASE)[0].strip()
+    series_name = SERIES_NAME_SPLIT_RE.split(title, 1)[0].strip()
     return {'is_series': True, 'season_number': season_number, 'series_name': series_name}
 
-def scrape_detail_page(url):
-    """Scrapes comprehensive details from a movie/series page."""
-    soup = get_soup(url)
-    if not soup: return None
+def make_soup(html, fast=FAST_HTML_PARSE):
+    """Parses a page with html.parser, or with lxml when fast is set."""
+    # The whole document is parsed either way: selectors such as a[href*="imdb.com"] take the first match
+    # on the page, so restricting the tree to <main> would change which element they pick.
+    return BeautifulSoup(html, FAST_HTML_PARSER if fast else 'html.parser')
 
+def parse_detail_page(html, url, fast=FAST_HTML_PARSE):
+    """Parses the details of a movie/series page from its raw HTML."""
+    return parse_detail_soup(make_soup(html, fast), url)
+
+def parse_detail_soup(soup, url):
     try:
         details = {'source_url': url}
         
@@ -131,14 +178,103 @@ def scrape_detail_page(url):
         return None
 
 
+# --- Async Fetcher ---
+class FetchResult(NamedTuple):
+    url: str
+    status: int
+    text: str
+    headers: dict
+
+class Fetcher:
+    """Async HTTP client with bounded concurrency, per-host politeness and adaptive back-off."""
+
+    def __init__(self, concurrency=CONCURRENCY, host_delay=HOST_DELAY):
+        self.concurrency = concurrency
+        self.base_delay = host_delay
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.host_delay = {}  # host -> current politeness delay
+        self.host_next = {}   # host -> loop time of the earliest next request start
+        self.host_locks = {}
+        self.requests = 0
+        self.retries = 0
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.concurrency, keepalive_timeout=60, ttl_dns_cache=300)
+        headers = {**HEADERS, 'Accept-Encoding': 'gzip, deflate'}
+        self.session = aiohttp.ClientSession(connector=connector, headers=headers, timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT))
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    async def _wait_turn(self, host):
+        loop = asyncio.get_running_loop()
+        async with self.host_locks.setdefault(host, asyncio.Lock()):
+            wait = self.host_next.get(host, 0) - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.host_next[host] = loop.time() + self.host_delay.get(host, self.base_delay)
+
+    def _back_off(self, host, retry_after=None):
+        delay = min(max(self.host_delay.get(host, self.base_delay), 0.5) * 2, MAX_HOST_DELAY)
+        self.host_delay[host] = delay
+        pause = float(retry_after) if retry_after and retry_after.isdigit() else delay
+        self.host_next[host] = asyncio.get_running_loop().time() + pause
+        self.retries += 1
+
+    def _recover(self, host):
+        # Decay the delay back towards the base after a successful response.
+        if (delay := self.host_delay.get(host)) and delay > self.base_delay:
+            self.host_delay[host] = max(self.base_delay, delay * 0.75)
+
+    async def fetch(self, url, headers=None) -> Optional[FetchResult]:
+        host = urlparse(url).netloc
+        for attempt in range(MAX_RETRIES + 1):
+            async with self.semaphore:
+                await self._wait_turn(host)
+                self.requests += 1
+                try:
+                    async with self.session.get(url, headers=headers) as resp:
+                        if resp.status == 429 or resp.status >= 500:
+                            logger.warning(f"HTTP {resp.status} from {url} (attempt {attempt + 1}), backing off.")
+                            self._back_off(host, resp.headers.get('Retry-After'))
+                            continue
+                        if resp.status >= 400:
+                            logger.error(f"Error fetching {url}: HTTP {resp.status}")
+                            return None
+                        try:
+                            text = await resp.text() if resp.status != 304 else ""
+                        except UnicodeDecodeError as e:
+                            # A body that can't be decoded in its declared charset won't decode on a retry either.
+                            logger.error(f"Error decoding {url}: {e}")
+                            return None
+                        self._recover(host)
+                        return FetchResult(url, resp.status, text, dict(resp.headers))
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.warning(f"Error fetching {url} (attempt {attempt + 1}): {e!r}")
+                    self._back_off(host)
+        logger.error(f"Giving up on {url} after {MAX_RETRIES + 1} attempts.")
+        return None
+
+
 # --- Database Functions ---
 
-async def upsert_subtitle(conn, post_details):
-    """Inserts or updates a subtitle entry in the database."""
+SUBTITLE_COLUMNS = [
+    'unique_id', 'imdb_id', 'source_url', 'scraped_at', 'title', 'year', 'is_series',
+    'season_number', 'series_name', 'total_seasons', 'srt_url', 'poster_url', 'imdb_url',
+    'description', 'director', 'genre', 'language', 'translator', 'imdb_rating',
+    'msone_release', 'certification', 'poster_maker', 'search_title', 'details_text',
+]
+# total_seasons is maintained by update_total_seasons, so it is not overwritten on conflict.
+MERGE_COLUMNS = [c for c in SUBTITLE_COLUMNS if c not in ('unique_id', 'imdb_id', 'total_seasons')]
+
+def build_db_record(post_details):
+    """Converts scraped page details into a row tuple ordered like SUBTITLE_COLUMNS."""
     imdb_id = extract_imdb_id(post_details.get('imdbURL'))
     if not imdb_id:
         logger.warning(f"Skipping entry with no IMDb ID: {post_details.get('title')}")
-        return 0
+        return None
 
     unique_id = f"{imdb_id}-S{post_details['season_number']}" if post_details.get('is_series') else imdb_id
 
@@ -165,31 +301,281 @@ async def upsert_subtitle(conn, post_details):
         'msone_release': json.dumps(post_details.get('msone_release')) if post_details.get('msone_release') else None,
         'certification': json.dumps(post_details.get('certification')) if post_details.get('certification') else None,
         'poster_maker': json.dumps(post_details.get('poster_maker')) if post_details.get('poster_maker') else None,
+        'search_title': normalize_title(post_details.get('title')),
+        'details_text': None, # Cleared so the bot re-renders the details card from the new data
     }
+    return tuple(db_record[column] for column in SUBTITLE_COLUMNS)
+
+class PageCache:
+    """HTTP validators (ETag, Last-Modified, body hash) per source_url, persisted in `page_cache`."""
+
+    def __init__(self):
+        self.entries = {}  # source_url -> (etag, last_modified, content_hash)
+
+    async def load(self, conn):
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS page_cache (
+                source_url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT,
+                checked_at TIMESTAMPTZ
+            );
+        """)
+        rows = await conn.fetch("SELECT source_url, etag, last_modified, content_hash FROM page_cache")
+        self.entries = {r['source_url']: (r['etag'], r['last_modified'], r['content_hash']) for r in rows}
+        logger.info(f"Loaded {len(self.entries)} cached page validators.")
+
+    def conditional_headers(self, url):
+        etag, last_modified, _ = self.entries.get(url, (None, None, None))
+        headers = {}
+        if etag: headers['If-None-Match'] = etag
+        if last_modified: headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def validators_for(self, result):
+        content_hash = hashlib.sha256(result.text.encode('utf-8')).hexdigest()
+        return (result.headers.get('ETag'), result.headers.get('Last-Modified'), content_hash)
+
+    def is_unchanged(self, result, validators):
+        if result.status == 304: return True
+        cached = self.entries.get(result.url)
+        return bool(cached) and cached[2] == validators[2]
+
+class BulkWriter:
+    """Buffers subtitle rows and merges them into `subtitles` via COPY into a staging table.
+
+    Each page is marked done in the crawl state only once the transaction holding its row commits, and failed if it doesn't.
+    """
 
-    query = """
-        INSERT INTO subtitles (
-            unique_id, imdb_id, source_url, scraped_at, title, year, is_series,
-            season_number, series_name, total_seasons, srt_url, poster_url, imdb_url,
-            description, director, genre, language, translator, imdb_rating,
-            msone_release, certification, poster_maker
-        ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, $15, $16, $17, $18, $19, $20, $21, $22)
-        ON CONFLICT (unique_id) DO UPDATE SET
-            source_url = EXCLUDED.source_url, scraped_at = EXCLUDED.scraped_at, title = EXCLUDED.title,
-            year = EXCLUDED.year, is_series = EXCLUDED.is_series, season_number = EXCLUDED.season_number,
-            series_name = EXCLUDED.series_name, srt_url = EXCLUDED.srt_url, poster_url = EXCLUDED.poster_url,
-            imdb_url = EXCLUDED.imdb_url, description = EXCLUDED.description, director = EXCLUDED.director,
-            genre = EXCLUDED.genre, language = EXCLUDED.language, translator = EXCLUDED.translator,
-            imdb_rating = EXCLUDED.imdb_rating, msone_release = EXCLUDED.msone_release,
-            certification = EXCLUDED.certification, poster_maker = EXCLUDED.poster_maker;
+    def __init__(self, conn, crawl_state=None, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.conn = conn
+        self.crawl_state = crawl_state
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer = {}  # unique_id -> row; a later scrape of the same id replaces the earlier one
+        self.validators = {}  # source_url -> (etag, last_modified, content_hash), saved with the rows
+        self.touched = set()  # source_urls whose page was unchanged; only scraped_at is bumped
+        self.pages = set()  # source_urls whose rows and validators are in the buffer
+        self.last_flush = time.monotonic()
+        self.written = 0
+        self.staging_ready = False
+
+    def seconds_until_flush(self):
+        pending = self.buffer or self.touched
+        return max(0.0, self.last_flush + self.flush_interval - time.monotonic()) if pending else None
+
+    async def add(self, post_details, validators=None):
+        self.pages.add(post_details['source_url'])
+        # Validators are kept even for pages that yield no row, so discovery treats them as known.
+        if validators:
+            self.validators[post_details['source_url']] = validators
+        if not (record := build_db_record(post_details)): return
+        self.buffer[record[0]] = record
+        if len(self.buffer) >= self.batch_size:
+            await self.flush()
+
+    async def touch(self, source_url):
+        self.touched.add(source_url)
+        if len(self.touched) >= self.batch_size:
+            await self.flush()
+
+    async def _ensure_staging(self):
+        if self.staging_ready: return
+        await self.conn.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS subtitles_staging (LIKE subtitles INCLUDING DEFAULTS) ON COMMIT DELETE ROWS;"
+        )
+        self.staging_ready = True
+
+    def _settle(self, urls, ok, error):
+        """Records the outcome of a write for the pages it covered."""
+        if not self.crawl_state: return
+        for url in urls:
+            if ok: self.crawl_state.done(url)
+            else: self.crawl_state.failed(url, error)
+
+    async def flush(self):
+        """Writes everything buffered; returns False if any of it could not be written."""
+        self.last_flush = time.monotonic()
+        ok = await self._flush_touched() if self.touched else True
+        if not self.buffer and not self.validators:
+            self._settle(self.pages, True, None)
+            self.pages.clear()
+            return ok
+        records = list(self.buffer.values())
+        validators = [(url, *v) for url, v in self.validators.items()]
+        pages = list(self.pages)
+        self.buffer.clear()
+        self.validators.clear()
+        self.pages.clear()
+
+        columns = ", ".join(SUBTITLE_COLUMNS)
+        updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in MERGE_COLUMNS)
+        merge_query = f"""
+            INSERT INTO subtitles ({columns})
+            SELECT {columns} FROM subtitles_staging
+            ON CONFLICT (unique_id) DO UPDATE SET {updates};
+        """
+        try:
+            await self._ensure_staging()
+            with stage_timers['write'].time(len(records)):
+                async with self.conn.transaction():
+                    await self.conn.copy_records_to_table('subtitles_staging', records=records, columns=SUBTITLE_COLUMNS)
+                    status = await self.conn.execute(merge_query)
+                    # Validators are only stored once the rows they describe are written.
+                    await self.conn.executemany("""
+                        INSERT INTO page_cache (source_url, etag, last_modified, content_hash, checked_at)
+                        VALUES ($1, $2, $3, $4, now())
+                        ON CONFLICT (source_url) DO UPDATE SET etag = EXCLUDED.etag, last_modified = EXCLUDED.last_modified,
+                            content_hash = EXCLUDED.content_hash, checked_at = EXCLUDED.checked_at;
+                    """, validators)
+            rows = int(status.split()[-1])
+            self.written += rows
+            if rows: await self.conn.execute("SELECT pg_notify($1, $2)", SUBTITLES_CHANNEL, str(rows))
+            logger.info(f"Flushed {rows} rows into subtitles ({self.written} total) in {time.monotonic() - self.last_flush:.2f}s.")
+        except Exception as e:
+            logger.error(f"Bulk write of {len(records)} rows failed: {e}")
+            self._settle(pages, False, f"write failed: {e}")
+            return False
+        self._settle(pages, True, None)
+        return ok
+
+    async def _flush_touched(self):
+        urls = list(self.touched)
+        self.touched.clear()
+        try:
+            async with self.conn.transaction():
+                await self.conn.execute("UPDATE subtitles SET scraped_at = $1 WHERE source_url = ANY($2::text[])", datetime.now(), urls)
+                await self.conn.execute("UPDATE page_cache SET checked_at = now() WHERE source_url = ANY($1::text[])", urls)
+        except Exception as e:
+            logger.error(f"Failed to bump scraped_at for {len(urls)} unchanged pages: {e}")
+            self._settle(urls, False, f"write failed: {e}")
+            return False
+        self._settle(urls, True, None)
+        return True
+
+class CrawlState:
+    """The listing cursor and per-URL crawl status, checkpointed to `crawl_state` and `crawl_urls` so a run can resume.
+
+    State is kept per run kind (the discovery mode), so a daily feed run never resets an interrupted full listing crawl.
     """
-    try:
-        await conn.execute(query, *db_record.values())
-        logger.info(f"UPSERTED: {db_record['title']} ({db_record['unique_id']})")
-        return 1
-    except Exception as e:
-        logger.error(f"Error upserting {db_record['unique_id']}: {e}")
-    return 0
+
+    def __init__(self, conn, run='listing', interval=CHECKPOINT_INTERVAL, max_attempts=MAX_ATTEMPTS):
+        self.conn = conn
+        self.run = run
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.listing_url = None  # Next listing page to read; None until the listing walk starts
+        self.page_num = 1
+        self.attempts = {}  # url -> failed attempts so far
+        self.dirty = {}  # url -> (status, error) changed since the last checkpoint
+        self.cursor_dirty = False
+        self.last_checkpoint = time.monotonic()
+        self.gave_up = 0
+
+    async def load(self, resume=False):
+        """Returns (pending URLs of an interrupted run, failed URLs to retry). A fresh run discards the old cursor."""
+        await self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS crawl_state (
+                name TEXT PRIMARY KEY,
+                listing_url TEXT,
+                page_num INTEGER,
+                started_at TIMESTAMPTZ,
+                finished_at TIMESTAMPTZ,
+                updated_at TIMESTAMPTZ
+            );
+        """)
+        await self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS crawl_urls (
+                run TEXT NOT NULL DEFAULT 'listing',
+                url TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER DEFAULT 0,
+                last_error TEXT,
+                updated_at TIMESTAMPTZ
+            );
+            -- Rows from before runs were kept apart belong to the listing crawl; the key moves from url to (run, url).
+            ALTER TABLE crawl_urls ADD COLUMN IF NOT EXISTS run TEXT NOT NULL DEFAULT 'listing';
+            ALTER TABLE crawl_urls DROP CONSTRAINT IF EXISTS crawl_urls_pkey;
+            CREATE UNIQUE INDEX IF NOT EXISTS crawl_urls_run_url ON crawl_urls (run, url);
+        """)
+        rows = await self.conn.fetch("SELECT url, attempts FROM crawl_urls WHERE run = $1 AND status = 'failed'", self.run)
+        self.attempts = {r['url']: r['attempts'] for r in rows}
+        retry = [url for url, attempts in self.attempts.items() if attempts < self.max_attempts]
+
+        cursor = await self.conn.fetchrow("SELECT listing_url, page_num, started_at FROM crawl_state WHERE name = $1 AND finished_at IS NULL", self.run)
+        if resume and cursor:
+            self.listing_url, self.page_num = cursor['listing_url'], cursor['page_num'] or 1
+            pending = [r['url'] for r in await self.conn.fetch("SELECT url FROM crawl_urls WHERE run = $1 AND status = 'pending' ORDER BY updated_at", self.run)]
+            logger.info(f"Resuming the {self.run} crawl started at {cursor['started_at']}: listing page {self.page_num} "
+                        f"({self.listing_url or 'not reached'}), {len(pending)} pending and {len(retry)} failed pages to retry.")
+            return pending, retry
+
+        if resume: logger.info(f"No interrupted {self.run} crawl to resume; starting a new one.")
+        async with self.conn.transaction():
+            await self.conn.execute("DELETE FROM crawl_urls WHERE run = $1 AND status <> 'failed'", self.run)
+            await self.conn.execute("""
+                INSERT INTO crawl_state (name, listing_url, page_num, started_at, finished_at, updated_at)
+                VALUES ($1, NULL, 1, now(), NULL, now())
+                ON CONFLICT (name) DO UPDATE SET listing_url = NULL, page_num = 1, started_at = now(), finished_at = NULL, updated_at = now();
+            """, self.run)
+        if retry: logger.info(f"Retrying {len(retry)} pages that failed in earlier runs.")
+        return [], retry
+
+    async def enqueue(self, detail_queue, url):
+        self.dirty[url] = ('pending', None)
+        await detail_queue.put(url)
+
+    def set_cursor(self, listing_url, page_num):
+        self.listing_url, self.page_num = listing_url, page_num
+        self.cursor_dirty = True
+
+    def done(self, url):
+        self.attempts.pop(url, None)
+        self.dirty[url] = ('done', None)
+
+    def failed(self, url, error):
+        self.attempts[url] = attempts = self.attempts.get(url, 0) + 1
+        self.dirty[url] = ('failed', error)
+        if attempts >= self.max_attempts:
+            self.gave_up += 1
+            logger.warning(f"Giving up on {url} after {attempts} failed attempts ({error}).")
+
+    def seconds_until_checkpoint(self):
+        pending = self.dirty or self.cursor_dirty
+        return max(0.0, self.last_checkpoint + self.interval - time.monotonic()) if pending else None
+
+    async def checkpoint(self):
+        """Saves the statuses and cursor. Call it only after a flush, so 'done' never runs ahead of the written rows."""
+        self.last_checkpoint = time.monotonic()
+        if not (self.dirty or self.cursor_dirty): return
+        # Take the batch before awaiting: workers and discovery keep recording statuses while it is written.
+        batch, self.dirty = self.dirty, {}
+        listing_url, page_num, self.cursor_dirty = self.listing_url, self.page_num, False
+        rows = [(self.run, url, status, self.attempts.get(url, 0), error) for url, (status, error) in batch.items()]
+        try:
+            async with self.conn.transaction():
+                await self.conn.executemany("""
+                    INSERT INTO crawl_urls (run, url, status, attempts, last_error, updated_at) VALUES ($1, $2, $3, $4, $5, now())
+                    ON CONFLICT (run, url) DO UPDATE SET status = EXCLUDED.status, attempts = EXCLUDED.attempts,
+                        last_error = EXCLUDED.last_error, updated_at = EXCLUDED.updated_at;
+                """, rows)
+                await self.conn.execute("UPDATE crawl_state SET listing_url = $1, page_num = $2, updated_at = now() WHERE name = $3", listing_url, page_num, self.run)
+            logger.info(f"Checkpointed {len(rows)} page statuses at listing page {page_num}.")
+        except Exception as e:
+            # Statuses recorded since the batch was taken are newer, so they win over the unsaved ones.
+            for url, status in batch.items():
+                self.dirty.setdefault(url, status)
+            self.cursor_dirty = True
+            logger.error(f"Crawl checkpoint failed, it will be retried: {e}")
+
+    async def finish(self):
+        """Marks the crawl finished unless the listing walk was cut short by a failed listing page."""
+        await self.checkpoint()
+        if self.listing_url:
+            logger.warning(f"The listing walk stopped at page {self.page_num} ({self.listing_url}); run with --resume to continue it.")
+            return
+        await self.conn.execute("UPDATE crawl_state SET finished_at = now(), updated_at = now() WHERE name = $1", self.run)
 
 async def update_total_seasons(conn):
     """Queries the database to calculate and update the total_seasons for all series."""
@@ -205,7 +591,11 @@ async def update_total_seasons(conn):
         logger.info("No series found to update.")
         return
 
-    update_query = "UPDATE subtitles SET total_seasons = $1 WHERE is_series = TRUE AND series_name = $2;"
+    # The bot's cached details card shows total_seasons, so clear it whenever the count changes.
+    update_query = """
+        UPDATE subtitles SET total_seasons = $1, details_text = NULL
+        WHERE is_series = TRUE AND series_name = $2 AND total_seasons IS DISTINCT FROM $1;
+    """
     updates = [(record['season_count'], record['series_name']) for record in series_counts]
 
     try:
@@ -214,79 +604,376 @@ async def update_total_seasons(conn):
     except Exception as e:
         logger.error(f"Failed to update total_seasons: {e}")
 
-async def main():
+# --- Crawl Pipeline ---
+class StageTimer:
+    """Counts the items through a pipeline stage and the wall time during which at least one was in progress."""
+
+    def __init__(self):
+        self.items = 0
+        self.active = 0.0
+        self.in_flight = 0
+        self.since = 0.0
+
+    @contextmanager
+    def time(self, items=1):
+        if self.in_flight == 0: self.since = time.monotonic()
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.items += items
+            if self.in_flight == 0: self.active += time.monotonic() - self.since
+
+    def summary(self, unit="pages"):
+        rate = self.items / self.active if self.active else 0.0
+        return f"{rate:.2f} {unit}/s ({self.items} in {self.active:.1f}s active)"
+
+stage_timers = {'fetch': StageTimer(), 'parse': StageTimer(), 'write': StageTimer()}
+
+class ParsePool:
+    """Runs parse_detail_page in worker processes, replacing the pool if a worker dies."""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.executor = self._start()
+
+    def _start(self):
+        # Workers only parse HTML; spawning them keeps the event loop and DB connection out of the children.
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    async def parse(self, html, url):
+        executor = self.executor
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, parse_detail_page, html, url, FAST_HTML_PARSE)
+        except BrokenProcessPool:
+            # Every page in flight fails with the pool; the first to notice replaces it for the pages still queued.
+            if self.executor is executor:
+                logger.error(f"A parse worker died while parsing {url}; starting a new pool.")
+                executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = self._start()
+            raise
+
+    def shutdown(self, **kwargs):
+        self.executor.shutdown(**kwargs)
+
+def start_parse_pool(workers=PARSE_WORKERS):
+    """Returns a ParsePool, or None to parse on the event loop."""
+    if workers <= 0: return None
+    logger.info(f"Parsing detail pages in {workers} worker processes.")
+    return ParsePool(workers)
+
+async def parse_detail(parse_pool, html, url):
+    """Parses a detail page into a plain dict, in the process pool when there is one."""
+    with stage_timers['parse'].time():
+        if parse_pool is None:
+            return parse_detail_page(html, url)
+        return await parse_pool.parse(html, url)
+
+async def load_known_urls(conn):
+    """Maps the canonical URL of every stored release, and every page checked before, to when it was last scraped."""
+    rows = await conn.fetch("""
+        SELECT source_url, MAX(scraped_at) AS scraped_at FROM (
+            SELECT source_url, scraped_at FROM subtitles WHERE source_url IS NOT NULL
+            UNION ALL
+            SELECT source_url, checked_at FROM page_cache
+        ) pages GROUP BY source_url
+    """)
+    return {canonical_url(r['source_url']): r['scraped_at'] for r in rows}
+
+def parse_listing_page(html):
+    """Returns the release URLs on a listing page, newest first, and the next listing page URL."""
+    soup = BeautifulSoup(html, 'html.parser')
+    detail_urls = [canonical_url(link['href']) for link in soup.select('article.loop-entry h2.entry-title a[href]')]
+    next_page_tag = soup.select_one('a.next.page-numbers[href]')
+    return detail_urls, urljoin(BASE_URL, next_page_tag['href']) if next_page_tag else None
+
+def _xml_children(element, name):
+    """Child elements by local name, whatever namespace the feed or sitemap declares."""
+    return [child for child in element if child.tag.rsplit('}', 1)[-1] == name]
+
+def _xml_text(element, name):
+    children = _xml_children(element, name)
+    return children[0].text.strip() if children and children[0].text else None
+
+def _parse_lastmod(value):
+    """Parses a W3C datetime (a date, or a date and time with offset) as an aware UTC datetime."""
+    if not value: return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return parsed.replace(tzinfo=timezone.utc) if parsed.tzinfo is None else parsed.astimezone(timezone.utc)
+
+def _is_site_url(url):
+    return urlparse(url).netloc == urlparse(BASE_URL).netloc
+
+def parse_feed(xml_text):
+    """Returns the post URLs of an RSS feed, newest first."""
+    channel = _xml_children(ET.fromstring(xml_text), 'channel')
+    items = _xml_children(channel[0], 'item') if channel else []
+    return [canonical_url(link) for item in items if (link := _xml_text(item, 'link')) and _is_site_url(link)]
+
+def parse_sitemap(xml_text):
+    """Returns ([(url, lastmod)], [(child sitemap url, lastmod)]) from a sitemap or sitemap index; lastmod may be None."""
+    root = ET.fromstring(xml_text)
+    entries = [(_xml_text(node, 'loc'), _parse_lastmod(_xml_text(node, 'lastmod'))) for node in _xml_children(root, 'url') + _xml_children(root, 'sitemap')]
+    entries = [(loc, lastmod) for loc, lastmod in entries if loc]
+    if root.tag.rsplit('}', 1)[-1] == 'sitemapindex':
+        return [], entries
+    return [(canonical_url(loc), lastmod) for loc, lastmod in entries if _is_site_url(loc)], []
+
+async def _fetch_xml(fetcher, url, parse):
+    """Fetches and parses a feed or sitemap, returning None if it is unavailable or malformed."""
+    result = await fetcher.fetch(url)
+    if not result: return None
+    try:
+        return parse(result.text)
+    except ET.ParseError as e:
+        logger.warning(f"Could not parse {url}: {e}")
+        return None
+
+async def read_sitemaps(fetcher, known_urls):
+    """Returns [(url, lastmod)] from SITEMAP_URL, following only index children that changed since the last scrape.
+
+    Returns None when the sitemap is unavailable, including an index none of whose changed post sitemaps could be read.
+    """
+    parsed = await _fetch_xml(fetcher, SITEMAP_URL, parse_sitemap)
+    if parsed is None: return None
+    entries, children = parsed
+    if children and not any(SITEMAP_CHILD_RE.search(url) for url, _ in children):
+        logger.warning(f"No child of {SITEMAP_URL} matches SCRAPER_SITEMAP_CHILD_PATTERN; treating the sitemap as unavailable.")
+        return None
+    last_scrape = max((t for t in known_urls.values() if t), default=None)
+    wanted = read = 0
+    for child_url, lastmod in children:
+        if not SITEMAP_CHILD_RE.search(child_url): continue
+        if last_scrape and lastmod and lastmod < last_scrape: continue
+        wanted += 1
+        if (child := await _fetch_xml(fetcher, child_url, parse_sitemap)) is not None:
+            entries += child[0]
+            read += 1
+    # An index whose changed children all failed says nothing about recent posts, so the caller must not rely on it.
+    if wanted and not read:
+        logger.warning(f"None of the {wanted} changed post sitemaps could be read.")
+        return None
+    return entries
+
+async def discover_from_feeds(fetcher, detail_queue, known_urls, crawl_state, stats):
+    """Queues new releases from the RSS feed and new or modified ones from the sitemaps.
+
+    Returns False when neither source could be read, or when the feed alone may have missed posts, so the caller
+    falls back to the paginated listing.
+    """
+    feed_urls = await _fetch_xml(fetcher, FEED_URL, parse_feed)
+    sitemap_entries = await read_sitemaps(fetcher, known_urls)
+    if feed_urls is None and sitemap_entries is None:
+        logger.warning("Neither the feed nor the sitemap is available.")
+        return False
+
+    feed_all_new = bool(feed_urls) and not any(url in known_urls for url in feed_urls)
+    candidates = {url: None for url in feed_urls or []}
+    for url, lastmod in sitemap_entries or []:
+        candidates[url] = max(filter(None, (lastmod, candidates.get(url))), default=None)
+
+    queued = modified = 0
+    for url, lastmod in candidates.items():
+        if url in known_urls:
+            scraped_at = known_urls[url]
+            if not (lastmod and scraped_at and lastmod > scraped_at):
+                stats['known'] += 1
+                continue
+            modified += 1
+        known_urls[url] = None
+        await crawl_state.enqueue(detail_queue, url)
+        queued += 1
+    logger.info(f"Feed and sitemap discovery queued {queued} releases ({modified} modified since last scraped) "
+                f"from {len(feed_urls or [])} feed items and {len(sitemap_entries or [])} sitemap entries.")
+
+    # The feed only carries the latest posts; if all of them are new, older new posts may be missing from it.
+    if sitemap_entries is None and feed_all_new:
+        logger.info("Every feed item was new and no sitemap was read, so the listing is walked as well.")
+        return False
+    return True
+
+async def discover_listing_pages(fetcher, detail_queue, known_urls, crawl_state, stats):
+    """Walks the paginated release listing, from the crawl cursor if resuming, and queues detail URLs that are not yet known.
+
+    The listing is newest first, so a run of STOP_AFTER_KNOWN known entries means everything older was scraped before.
+    """
+    current_page_url = crawl_state.listing_url or RELEASES_URL
+    page_num = crawl_state.page_num if crawl_state.listing_url else 1
+    consecutive_known = 0
+
+    while page_num <= MAX_PAGES:
+        # Point the cursor at this page first, so a failed fetch leaves the run unfinished and resumable here.
+        crawl_state.set_cursor(current_page_url, page_num)
+        logger.info(f"Scraping page {page_num}/{MAX_PAGES}: {current_page_url}")
+        result = await fetcher.fetch(current_page_url)
+        if not result: break
+        detail_urls, next_page_url = parse_listing_page(result.text)
+        stats['listing_pages'] += 1
+        if not detail_urls:
+            crawl_state.set_cursor(None, page_num)
+            break
+
+        for detail_url in detail_urls:
+            if detail_url in known_urls:
+                stats['known'] += 1
+                consecutive_known += 1
+                if STOP_AFTER_KNOWN and consecutive_known >= STOP_AFTER_KNOWN:
+                    logger.info(f"Stopping early: {consecutive_known} consecutive entries were already scraped.")
+                    crawl_state.set_cursor(None, page_num + 1)
+                    return
+                continue
+
+            consecutive_known = 0
+            known_urls[detail_url] = None
+            await crawl_state.enqueue(detail_queue, detail_url)
+
+        # Every entry of this page is queued (and recorded as pending), so a resume can start at the next one.
+        crawl_state.set_cursor(next_page_url, page_num + 1)
+        if not next_page_url:
+            logger.info("No next page found or reached the last page.")
+            break
+        current_page_url = next_page_url
+        page_num += 1
+    else:
+        crawl_state.set_cursor(None, page_num)
+
+async def detail_worker(fetcher, page_cache, detail_queue, write_queue, crawl_state, stats, parse_pool=None):
+    """Fetches and parses detail pages until it receives the None sentinel."""
+    while (url := await detail_queue.get()) is not None:
+        # One bad page must not end the worker: gather() on the workers would take the whole run down with it.
+        try:
+            with stage_timers['fetch'].time():
+                result = await fetcher.fetch(url, headers=page_cache.conditional_headers(url))
+            stats['detail_pages'] += 1
+            if not result:
+                stats['failed'] += 1
+                crawl_state.failed(url, "fetch failed")
+                continue
+
+            validators = page_cache.validators_for(result)
+            if page_cache.is_unchanged(result, validators):
+                stats['unchanged'] += 1
+                await write_queue.put(('touch', url))
+            elif post_details := await parse_detail(parse_pool, result.text, url):
+                await write_queue.put(('upsert', post_details, validators))
+            else:
+                stats['failed'] += 1
+                crawl_state.failed(url, "parse failed")
+        except Exception as e:
+            logger.exception(f"Failed to process {url}")
+            stats['failed'] += 1
+            crawl_state.failed(url, f"{type(e).__name__}: {e}")
+
+async def db_writer(writer, write_queue, crawl_state):
+    """Feeds queued writes into the bulk writer until it receives the None sentinel, checkpointing the crawl as it goes."""
+    while True:
+        deadlines = [t for t in (writer.seconds_until_flush(), crawl_state.seconds_until_checkpoint()) if t is not None]
+        try:
+            item = await asyncio.wait_for(write_queue.get(), timeout=min(deadlines, default=None))
+        except asyncio.TimeoutError:
+            item = False
+        if item is None: break
+        # The writer marks each page done or failed once its write commits or fails.
+        if item and item[0] == 'touch':
+            await writer.touch(item[1])
+        elif item:
+            await writer.add(item[1], item[2])
+
+        if crawl_state.seconds_until_checkpoint() == 0:
+            await writer.flush()
+            await crawl_state.checkpoint()
+        elif item is False:
+            await writer.flush()
+    await writer.flush()
+    await crawl_state.checkpoint()
+
+async def main(discovery=DISCOVERY, resume=False):
     """Main async scraper function."""
     if not DATABASE_URL:
         logger.error("DATABASE_URL environment variable not set. Cannot run scraper.")
         return
 
     conn = None
-    newly_added_count = 0
+    stats = {'listing_pages': 0, 'detail_pages': 0, 'failed': 0, 'unchanged': 0, 'upserted': 0, 'known': 0}
+    started = time.monotonic()
     try:
         conn = await asyncpg.connect(DATABASE_URL)
         logger.info("Successfully connected to the database.")
 
-        # --- Update old series entries ---
+        # The bot normally adds these columns on startup; the scraper may run first after a deploy.
+        await conn.execute("ALTER TABLE subtitles ADD COLUMN IF NOT EXISTS search_title TEXT;")
+        await conn.execute("ALTER TABLE subtitles ADD COLUMN IF NOT EXISTS details_text TEXT;")
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_subtitles_source_url ON subtitles (source_url);")
+
+        page_cache = PageCache()
+        await page_cache.load(conn)
+        crawl_state = CrawlState(conn, discovery)
+        pending, retry = await crawl_state.load(resume)
+
+        # All reads happen before the workers start; from then on the connection belongs to the writer.
         seven_days_ago = datetime.now() - timedelta(days=7)
         old_series_to_update = await conn.fetch("SELECT unique_id, source_url, title FROM subtitles WHERE is_series = TRUE AND scraped_at < $1", seven_days_ago)
+        known_urls = await load_known_urls(conn)
+        logger.info(f"Loaded {len(known_urls)} known release URLs from database.")
+
+        detail_queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        write_queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+        parse_pool = start_parse_pool()
+        async with Fetcher() as fetcher:
+            workers = [asyncio.create_task(detail_worker(fetcher, page_cache, detail_queue, write_queue, crawl_state, stats, parse_pool)) for _ in range(CONCURRENCY)]
+            bulk_writer = BulkWriter(conn, crawl_state)
+            writer = asyncio.create_task(db_writer(bulk_writer, write_queue, crawl_state))
+            try:
+                # --- Pages left over from an interrupted run, and earlier failures ---
+                queued = dict.fromkeys(pending + retry)
+                for url in queued:
+                    known_urls[canonical_url(url)] = None
+                    await crawl_state.enqueue(detail_queue, url)
+
+                # --- Update old series entries ---
+                logger.info(f"Found {len(old_series_to_update)} series entries older than 7 days to check for updates.")
+                for record in old_series_to_update:
+                    if record['source_url'] and record['source_url'] not in queued:
+                        await crawl_state.enqueue(detail_queue, record['source_url'])
+
+                # --- Scrape for new entries ---
+                logger.info("Scraping for new entries...")
+                if crawl_state.listing_url:
+                    await discover_listing_pages(fetcher, detail_queue, known_urls, crawl_state, stats)
+                elif crawl_state.page_num > 1:
+                    logger.info("The resumed run had already finished its listing walk; only its leftover pages are fetched.")
+                elif discovery != 'feed' or not await discover_from_feeds(fetcher, detail_queue, known_urls, crawl_state, stats):
+                    await discover_listing_pages(fetcher, detail_queue, known_urls, crawl_state, stats)
+
+                for _ in workers:
+                    await detail_queue.put(None)
+                await asyncio.gather(*workers)
+                await write_queue.put(None)
+                await writer
+                stats['upserted'] = bulk_writer.written
+            finally:
+                for task in [*workers, writer]:
+                    task.cancel()
+                if parse_pool: parse_pool.shutdown(cancel_futures=True)
+
+        await crawl_state.finish()
+        elapsed = time.monotonic() - started
+        logger.info(
+            f"Scraping finished in {elapsed:.1f}s. Added/updated {stats['upserted']} entries from "
+            f"{stats['listing_pages']} listing and {stats['detail_pages']} detail pages, {stats['known']} known entries skipped "
+            f"({stats['detail_pages'] / elapsed:.2f} pages/s, {stats['unchanged']} refreshes skipped as unchanged, "
+            f"{stats['failed']} failed, {crawl_state.gave_up} given up, {fetcher.retries} retries)."
+        )
+        logger.info(
+            f"Stage throughput: fetch {stage_timers['fetch'].summary()}, parse {stage_timers['parse'].summary()} "
+            f"with {PARSE_WORKERS or 'no'} worker processes, write {stage_timers['write'].summary('rows')}."
+        )
 
-        logger.info(f"Found {len(old_series_to_update)} series entries older than 7 days to check for updates.")
-        for record in old_series_to_update:
-            post_details = scrape_detail_page(record['source_url'])
-            if post_details:
-                await upsert_subtitle(conn, post_details)
-                await asyncio.sleep(0.2)
-
-        # --- Scrape for new entries ---
-        logger.info("Scraping for new entries...")
-        current_page_url = RELEASES_URL
-        page_num = 1
-
-        existing_ids_set = {r['unique_id'] for r in await conn.fetch("SELECT unique_id FROM subtitles")}
-        logger.info(f"Loaded {len(existing_ids_set)} existing IDs from database.")
-
-        while page_num <= MAX_PAGES:
-            logger.info(f"Scraping page {page_num}/{MAX_PAGES}: {current_page_url}")
-            list_soup = get_soup(current_page_url)
-            if not list_soup: break
-
-            entries = list_soup.select('article.loop-entry')
-            if not entries: break
-
-            new_on_this_page = 0
-            for entry in entries:
-                link_tag = entry.select_one('h2.entry-title a')
-                if not (link_tag and link_tag.get('href')): continue
-
-                detail_url = urljoin(BASE_URL, link_tag['href'])
-                imdb_id_from_url = extract_imdb_id(detail_url)
-                if imdb_id_from_url and imdb_id_from_url in existing_ids_set:
-                    continue
-
-                post_details = scrape_detail_page(detail_url)
-                if not post_details: continue
-
-                added = await upsert_subtitle(conn, post_details)
-                if added:
-                    newly_added_count += 1
-                    new_on_this_page += 1
-                await asyncio.sleep(0.1)
-
-            if new_on_this_page == 0 and page_num > 5:
-                logger.info("Stopping early: No new entries found on this page.")
-                break
-
-            next_page_tag = list_soup.select_one('a.next.page-numbers')
-            if next_page_tag and next_page_tag.get('href'):
-                current_page_url = urljoin(BASE_URL, next_page_tag['href'])
-                page_num += 1
-            else:
-                logger.info("No next page found or reached the last page.")
-                break
-            await asyncio.sleep(0.2)
-
-        logger.info(f"Scraping finished. Added/updated {newly_added_count} new entries.")
-        
         await update_total_seasons(conn)
 
     except Exception as e:
@@ -296,5 +983,31 @@ async def main():
             await conn.close()
             logger.info("Database connection closed.")
 
+def check_saved_feeds(paths):
+    """Prints what parse_feed/parse_sitemap extract from saved files, for checking discovery offline."""
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            text = f.read()
+        root_tag = ET.fromstring(text).tag.rsplit('}', 1)[-1]
+        if root_tag == 'rss':
+            urls = parse_feed(text)
+            print(f"{path}: RSS feed with {len(urls)} posts")
+            for url in urls: print(f"  {url}")
+        else:
+            entries, children = parse_sitemap(text)
+            print(f"{path}: {'sitemap index' if children else 'sitemap'} with {len(entries or children)} entries")
+            for url, lastmod in children:
+                print(f"  {url}  lastmod={lastmod}  {'followed' if SITEMAP_CHILD_RE.search(url) else 'ignored'}")
+            for url, lastmod in entries:
+                print(f"  {url}  lastmod={lastmod}")
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Scrapes new and updated releases into the subtitles table.")
+    parser.add_argument('--discovery', choices=['feed', 'listing'], default=DISCOVERY, help="how new releases are found (default: SCRAPER_DISCOVERY)")
+    parser.add_argument('--resume', action='store_true', help="continue an interrupted crawl from its last checkpoint")
+    parser.add_argument('--check-feeds', nargs='+', metavar='FILE', help="parse saved feed/sitemap files, print the result and exit")
+    args = parser.parse_args()
+    if args.check_feeds:
+        check_saved_feeds(args.check_feeds)
+    else:
+        asyncio.run(main(args.discovery, args.resume))